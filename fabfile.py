@@ -8,26 +8,460 @@ using Fabric. It includes functionality for deploying individual projects,
 
 """
 
+from __future__ import annotations
+
+import atexit
+import contextlib
+import difflib
+import fcntl
+import fnmatch
+import functools
+import hashlib
+import importlib
 import os
-
-from fabric2 import Connection, task
+import pickle
+import shlex
+import socket
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import Logger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from fabric2 import Config, Connection, task
 from invoke.collection import Collection
 from invoke.context import Context
+from invoke.exceptions import Exit
+from invoke.tasks import Task
 
-from fabricator.deploy import deploy_site
+from fabricator.config import SiteConf
 from fabricator.logger import get_logger
-from fabricator.recipes import (
-    release_lock,
-    restart_services,
-    rollback_to_previous_release,
-)
-from fabricator.runners import DockerRunner
-from fabricator.utils import load_sites, print_site_list
+from fabricator.utils import SITES_FILE, load_sites, print_site_list
+
+if TYPE_CHECKING:
+    from fabricator.runners import DockerRunner
+
+# Create a logger for messages not tied to a single site
+logger = get_logger("fabfile")
+
+# Runners created during this process, keyed by their target so that
+# several sites on the same host share one authenticated transport
+_CONN_POOL: dict[tuple, Connection | DockerRunner] = {}
+
+# Connection overrides from the environment, read once per process
+_ENV = {
+    "host": os.getenv("DEPLOYER_HOST"),
+    "user": os.getenv("DEPLOYER_USER"),
+    "port": os.getenv("DEPLOYER_PORT"),
+}
+
+# Per-user directory holding the parsed sites.yml cache and site locks
+CACHE_DIR = Path(
+    os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+) / "fabricator"
+
+# Port assumed when a site or DEPLOYER_PORT does not set one
+_DEFAULT_SSH_PORT = 22
+
+# Maximum number of sites processed concurrently by the *_all tasks
+_MAX_PARALLEL = max(1, int(os.getenv("DEPLOYER_PARALLEL", "8")))
+
+# Delay between the first workers, to avoid hitting sshd MaxStartups
+_STAGGER_SECONDS = 0.05
+
+# Optional ssh_config file applied to every SSH connection
+_SSH_CONFIG = os.getenv("DEPLOYER_SSH_CONFIG")
+
+# Per-site locks serializing work on the same site within a process
+_SITE_LOCKS: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+_SITE_LOCKS_GUARD = threading.Lock()
+
+# Help for the site filters accepted by the *_all tasks
+_FILTER_HELP = {
+    "only": "Comma-separated list of the only sites to process",
+    "exclude": "Comma-separated list of sites to skip",
+    "changed_since": (
+        "Git ref; only process sites whose 'paths' match a file changed "
+        "since it"
+    ),
+}
+
+
+
+def _sites_cache_file(path: str, mtime_ns: int, size: int) -> Path:
+    """
+    Build the pickle cache path for a given version of the sites file.
+
+    :param path: Path to the sites configuration file.
+    :type path: str
+
+    :param mtime_ns: Modification time of the file in nanoseconds.
+    :type mtime_ns: int
+
+    :param size: Size of the file in bytes.
+    :type size: int
+
+    :return: Location of the pickled configuration.
+    :rtype: Path
+    """
+    path_id = hashlib.sha1(path.encode()).hexdigest()[:12]
+    return CACHE_DIR / f"sites.{path_id}.{mtime_ns}.{size}.pkl"
+
+def _write_sites_cache(cache_file: Path, sites: dict) -> None:
+    """
+    Atomically store the parsed sites and drop stale cache versions.
+
+    Failures are ignored: the cache is only an optimization.
+
+    :param cache_file: Destination returned by `_sites_cache_file`.
+    :type cache_file: Path
+
+    :param sites: Parsed site configurations.
+    :type sites: dict
+    """
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump(sites, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+
+        # Remove cached versions of the same sites file
+        prefix = cache_file.name.split(".")[1]
+        for stale in cache_file.parent.glob(f"sites.{prefix}.*.pkl"):
+            if stale != cache_file:
+                stale.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def _to_site_confs(sites: dict) -> dict[str, SiteConf]:
+    """
+    Convert raw site entries into typed configurations.
+
+    :param sites: Parsed site configurations.
+    :type sites: dict
+
+    :return: Typed configuration of each site, keyed by site name.
+    :rtype: dict[str, SiteConf]
+    """
+    return {
+        name: SiteConf.from_dict(name, data) for name, data in sites.items()
+    }
+
+@functools.lru_cache(maxsize=1)
+def _load_sites_at(
+    path: str,
+    mtime_ns: int,
+    size: int
+) -> dict[str, SiteConf]:
+    """
+    Parse the sites file once per ``(path, mtime, size)`` version.
+
+    Within a process the result is kept by ``lru_cache``; across
+    processes it is read back from a pickle under ``~/.cache`` so CLI
+    invocations skip YAML parsing while the file is unchanged. Set
+    ``DEPLOYER_NO_CACHE`` to always parse the YAML file.
+
+    :param path: Path to the sites configuration file.
+    :type path: str
+
+    :param mtime_ns: Modification time of the file, used as cache key.
+    :type mtime_ns: int
+
+    :param size: Size of the file in bytes, used as cache key.
+    :type size: int
+
+    :return: Typed configuration of each site, keyed by site name.
+    :rtype: dict[str, SiteConf]
+    """
+    if os.getenv("DEPLOYER_NO_CACHE"):
+        return _to_site_confs(load_sites())
 
+    cache_file = _sites_cache_file(path, mtime_ns, size)
+    try:
+        with open(cache_file, "rb") as f:
+            return _to_site_confs(pickle.load(f))
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    sites = load_sites()
+    _write_sites_cache(cache_file, sites)
+    return _to_site_confs(sites)
+
+def _cached_load_sites() -> dict[str, SiteConf]:
+    """
+    Load the sites configuration, reusing the last parsed result.
+
+    The cache is keyed on the file modification time and size, so
+    edits to ``sites.yml`` are picked up on the next call.
+
+    :return: Typed configuration of each site, keyed by site name.
+    :rtype: dict[str, SiteConf]
+    """
+    st = os.stat(SITES_FILE)
+    return _load_sites_at(str(SITES_FILE), st.st_mtime_ns, st.st_size)
+
+def _pooled(
+    key: tuple,
+    factory: Callable[[], Connection | DockerRunner]
+) -> Connection | DockerRunner:
+    """
+    Return the pooled runner for ``key``, creating it on first use.
+
+    :param key: Hashable identifier of the connection target.
+    :type key: tuple
+
+    :param factory: Callable that builds a new runner for the target.
+    :type factory: Callable
+
+    :return: The shared runner for the given key.
+    :rtype: Union[Connection, DockerRunner]
+    """
+    if key not in _CONN_POOL:
+        _CONN_POOL[key] = factory()
+    return _CONN_POOL[key]
+
+def _close_pool() -> None:
+    """
+    Close every pooled SSH connection at interpreter exit.
+
+    Docker runners hold no transport of their own and are skipped.
+    """
+    for conn in _CONN_POOL.values():
+        if isinstance(conn, Connection):
+            conn.close()
+    _CONN_POOL.clear()
+
+atexit.register(_close_pool)
+
+@contextlib.contextmanager
+def _site_lock(site: str, logger: Logger) -> Iterator[None]:
+    """
+    Serialize work on a site within this process and across processes.
+
+    A thread lock covers concurrent workers of the same run, and an
+    ``flock`` on a file in the per-user `CACHE_DIR` covers overlapping
+    ``fab2`` invocations by the same user on this machine. Both are
+    released when the block exits, or by the kernel if the process dies.
+
+    :param site: Name of the site as defined in ``sites.yml``.
+    :type site: str
+
+    :param logger: Logger of the site.
+    :type logger: Logger
+    """
+    with _SITE_LOCKS_GUARD:
+        thread_lock = _SITE_LOCKS[site]
+
+    lock_path = CACHE_DIR / "locks" / f"{site}.lock"
+    lock_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    with thread_lock, open(lock_path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Waiting for another run on site %s", site)
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _run_parallel(
+    targets: list[
+        tuple[str, dict, Logger, Connection | DockerRunner | Context]
+    ],
+    action: Callable[[Connection | DockerRunner | Context, dict], None],
+    message: str
+) -> None:
+    """
+    Run an action for several sites on a bounded thread pool.
+
+    Sites are independent and their work is dominated by remote I/O, so
+    they are processed concurrently (up to ``DEPLOYER_PARALLEL`` at a
+    time). SSH connections are opened up front so workers sharing a
+    host reuse the same transport instead of racing to open it.
+
+    :param targets: Tuples of site name, config, logger and runner.
+    :type targets: list[tuple]
+
+    :param action: Recipe to execute for each site.
+    :type action: Callable
+
+    :param message: Log prefix announcing the action for each site.
+    :type message: str
+
+    :raises Exit: If the action failed for any site, after all of them
+            have run.
+    """
+    from fabricator.runners import open_transport
+
+    for _site, _config, _logger, conn in targets:
+        open_transport(conn)
+
+    def job(
+        index: int,
+        site: str,
+        config: dict,
+        logger: Logger,
+        conn: Connection | DockerRunner | Context
+    ) -> None:
+        # Stagger the first wave so connections do not start at once
+        if index < _MAX_PARALLEL:
+            time.sleep(_STAGGER_SECONDS * index)
+        with _site_lock(site, logger):
+            logger.info("%s: %s", message, config["name"])
+            action(conn, config)
+
+    with ThreadPoolExecutor(max_workers=_MAX_PARALLEL) as executor:
+        futures = {
+            executor.submit(job, index, *target): target
+            for index, target in enumerate(targets)
+        }
+        # Wait for every site, so one failure does not hide the others
+        failed = []
+        for future in as_completed(futures):
+            exc = future.exception()
+            if exc is not None:
+                site, _config, logger, _conn = futures[future]
+                logger.error("Failed for site %s: %s", site, exc)
+                failed.append(site)
+
+    # Exit non-zero once all sites are done if any of them failed
+    if failed:
+        msg = f"{len(failed)} site(s) failed: {', '.join(sorted(failed))}"
+        raise Exit(msg, code=1)
+
+def _ssh_connection(host: str, port: int, user: str | None) -> Connection:
+    """
+    Return the pooled SSH connection for a host, port and user.
+
+    If ``DEPLOYER_SSH_CONFIG`` is set, that ssh_config file is loaded for
+    the connection (e.g. to tunnel through a multiplexed OpenSSH master).
+
+    :param host: Remote host, optionally in ``user@host`` form.
+    :type host: str
+
+    :param port: Remote SSH port.
+    :type port: int
+
+    :param user: Remote user, or None to use Fabric's default.
+    :type user: str or None
+
+    :return: Shared connection for the given target.
+    :rtype: Connection
+    """
+    def factory() -> Connection:
+        # Fabric's transport (paramiko) ignores ControlMaster, so SSH
+        # level reuse across processes is configured with a ProxyCommand
+        # in the file pointed to by DEPLOYER_SSH_CONFIG
+        config = None
+        if _SSH_CONFIG:
+            config = Config(
+                overrides={"ssh_config_path": os.path.expanduser(_SSH_CONFIG)}
+            )
+        return Connection(host=host, user=user, port=port, config=config)
+
+    return _pooled(("ssh", host, port, user), factory)
+
+def _connection_from_env() -> Connection | None:
+    """
+    Return the connection defined by ``DEPLOYER_*`` variables, if any.
+
+    :return: Shared connection for ``DEPLOYER_HOST``, or None if unset.
+    :rtype: Connection or None
+    """
+    if not _ENV["host"]:
+        return None
+    port = int(_ENV["port"]) if _ENV["port"] else _DEFAULT_SSH_PORT
+    return _ssh_connection(_ENV["host"], port, _ENV["user"] or None)
+
+@functools.lru_cache(maxsize=1)
+def _local_context() -> Context:
+    """
+    Return the process-wide local context, created on first use.
+
+    Recipes never use ``cd`` or ``prefix`` on it, and ``Context.run``
+    builds a new runner per call, so it is safe to share between the
+    threads of the *_all tasks.
+
+    :return: Shared local context.
+    :rtype: Context
+    """
+    return Context()
+
+@functools.lru_cache(maxsize=1)
+def _local_names() -> frozenset[str]:
+    """
+    Return the names that refer to this machine.
+
+    Computed on first use, since ``getfqdn`` may need a DNS lookup.
+
+    :return: Loopback addresses and the local host names.
+    :rtype: frozenset[str]
+    """
+    return frozenset({
+        "localhost",
+        "127.0.0.1",
+        "::1",
+        socket.gethostname(),
+        socket.getfqdn(),
+    })
+
+@functools.lru_cache(maxsize=64)
+def _resolve_conn(
+    env_host: str | None,
+    env_user: str | None,
+    env_port: str | None,
+    site: SiteConf | None,
+    fb_is_local: bool
+) -> Connection | DockerRunner | Context | None:
+    """
+    Resolve a runner from hashable connection settings.
+
+    Memoized so that identical settings always map to the same runner
+    object, which keeps the connection pool effective.
+
+    :return: The runner to use, or None to keep the fallback runner.
+    :rtype: Union[Connection, DockerRunner, Context] or None
+    """
+    # 1. If environment variable is set, override all
+    if env_host:
+        port = int(env_port) if env_port else _DEFAULT_SSH_PORT
+        return _ssh_connection(env_host, port, env_user or None)
+
+    # 2. If Docker runner is configured
+    if site is not None and site.runner == "docker":
+        from fabricator.runners import DockerRunner
+
+        return _pooled(
+            ("docker", site.docker_container, site.docker_user),
+            lambda: DockerRunner(
+                container_name=site.docker_container,
+                inner_runner=_local_context(),
+                user=site.docker_user
+            )
+        )
+
+    # 3. If host is defined in config and not already remote
+    if site is not None and site.host is not None and fb_is_local:
+        # Run locally instead of opening an SSH session to ourselves
+        if site.port == _DEFAULT_SSH_PORT and site.host in _local_names():
+            return _local_context()
+        return _ssh_connection(site.host, site.port, None)
+
+    # 4. Fallback to local context if no remote host is detected
+    if fb_is_local:
+        return _local_context()
+
+    # 5. Default fallback
+    return None
 
 def get_connection(
     fallback_connection: Connection | DockerRunner | Context,
-    config: dict | None = None
+    site: SiteConf | None = None
 ) -> Connection | DockerRunner | Context:
     """
     Resolve the appropriate connection object for the site.
@@ -42,295 +476,487 @@ def get_connection(
     4. Fallback connection
     5. Default to local context
 
+    Environment variables are read once at import time, and the
+    resolution itself is memoized by `_resolve_conn`.
+
     :param fallback_connection: Default local or remote runner.
     :type fallback_connection: Union[Connection, DockerRunner, Context]
 
-    :param config: Optional site config loaded from YAML.
-    :type config: dict or None
+    :param site: Optional typed site config loaded from YAML.
+    :type site: SiteConf or None
 
     :return: A connection object suitable for deployment.
     :rtype: Union[Connection, DockerRunner, Context]
     """
-    # 1. If environment variable is set, override all
-    host = os.getenv("DEPLOYER_HOST")
-    user = os.getenv("DEPLOYER_USER")
-    port = os.getenv("DEPLOYER_PORT")
-    if host:
-        return Connection(
-            host=host,
-            user=user or None,
-            port=int(port) if port else 22
-        )
-
-    # 2. If Docker runner is configured
-    if config and config.get("runner") == "docker":
-        container = config["docker_container"]
-        docker_user = config.get("docker_user", "root")
-        return DockerRunner(
-            container_name=container,
-            inner_runner=Context(),
-            user=docker_user
-        )
-
-    # 3. If host is defined in config and not already remote
-    if (
-        config
-        and "host" in config
-        and getattr(fallback_connection, "host", "localhost") == "localhost"
-    ):
-        return Connection(
-            host=config["host"],
-            port=config.get("port", 22)
-        )
-
-    # 4. Fallback to local context if no remote host is detected
-    if getattr(fallback_connection, "host", "localhost") == "localhost":
-        return Context()
-
-    # 5. Default fallback
-    return fallback_connection
-
-@task(help={"site": "Name of the site to deploy"})
-def deploy(c: Connection | DockerRunner | Context, site: str) -> None:
+    conn = _resolve_conn(
+        _ENV["host"],
+        _ENV["user"],
+        _ENV["port"],
+        site,
+        getattr(fallback_connection, "host", "localhost") == "localhost"
+    )
+    return fallback_connection if conn is None else conn
+
+def _prepare_single(
+    c: Connection | DockerRunner | Context,
+    site: str
+) -> tuple[dict, Logger, Connection | DockerRunner | Context] | None:
     """
-    Deploy a single site defined in the configuration file.
+    Resolve config, logger and runner for a single site.
 
-    Loads site-specific configuration, resolves the proper connection
-    (local, Docker, or SSH), and runs the full deployment process.
+    Shared by the single-site tasks, which otherwise repeat the same
+    load, validate and connect sequence.
 
     :param c: Fabric connection or context object.
     :type c: Union[Connection, DockerRunner, Context]
 
     :param site: Name of the site as defined in ``sites.yml``.
     :type site: str
+
+    :return: Tuple of config, logger and runner, or None if the site is
+            not defined.
+    :rtype: tuple or None
     """
     # Load all site definitions from the YAML config
-    sites = load_sites()
+    sites = _cached_load_sites()
 
-    # Initialize logger for the given site
-    logger = get_logger(site)
+    # Look the site up, ignoring case as domain names do
+    site_conf = sites.get(site)
+    if site_conf is None:
+        by_lower = {name.lower(): name for name in sites}
+        site_conf = sites.get(by_lower.get(site.lower(), ""))
 
     # Abort if the requested site does not exist in config
-    if site not in sites:
-        logger.error(f"Site '{site}' not found in sites.yml")
-        return
+    if site_conf is None:
+        suggestions = difflib.get_close_matches(site, sites, n=1)
+        if suggestions:
+            get_logger(site).error(
+                "Site '%s' not found in sites.yml; did you mean '%s'?",
+                site,
+                suggestions[0]
+            )
+        else:
+            get_logger(site).error("Site '%s' not found in sites.yml", site)
+        return None
 
-    # Load config and set the site name explicitly
-    config = sites[site]
-    config['name'] = site
+    # Initialize logger for the given site
+    logger = get_logger(site_conf.name)
 
     # Resolve connection using environment vars if present
-    c = get_connection(c, config = config)
+    conn = get_connection(c, site = site_conf)
 
-    deploy_site(c, config)
+    # Hand the recipes their own mutable copy of the config
+    return site_conf.to_dict(), logger, conn
 
-@task
-def deploy_all(c: Connection | DockerRunner | Context) -> None:
+def _split_names(value: str) -> set[str]:
     """
-    Deploy all sites listed in the configuration file.
+    Parse a comma-separated list of site names.
 
-    Iterates through all entries in ``sites.yml`` and runs the
-    deployment pipeline for each one sequentially.
+    :param value: Site names separated by commas.
+    :type value: str
 
-    :param c: Fabric connection or context object.
-    :type c: Union[Connection, DockerRunner, Context]
+    :return: Set of non-empty, stripped names.
+    :rtype: set[str]
     """
-    # Load all site definitions
-    sites = load_sites()
+    return {name.strip() for name in value.split(",") if name.strip()}
 
-    # Deploy each site iteratively
-    for site, config in sites.items():
-        config['name'] = site
-        # Use remote connection if available from environment
-        c = get_connection(c, config = config)
-        logger = get_logger(site)
-        logger.info(f"Deploying site: {site}")
-        deploy_site(c, config)
-
-@task
-def list_sites(c: Connection | DockerRunner | Context) -> None:
+def _changed_paths(ref: str) -> list[str] | None:
     """
-    Display all configured sites and their repository URLs.
+    List the files changed in the local repository since a git ref.
 
-    Loads site data from ``sites.yml`` and prints the site name
-    alongside its associated Git repository.
+    :param ref: Git reference to compare the working tree against.
+    :type ref: str
 
-    :param c: Fabric connection or context object.
-    :type c: Union[Connection, DockerRunner, Context]
+    :return: Changed paths, or None if ``git diff`` failed.
+    :rtype: list[str] or None
     """
-    # Print table of available site names
-    print_site_list()
-
-@task(help={"site": "Name of the site to rollback"})
-def rollback(c: Connection | DockerRunner | Context, site: str) -> None:
+    result = _local_context().run(
+        f"git diff --name-only {shlex.quote(ref)}", hide=True, warn=True
+    )
+    if not result.ok:
+        logger.error("Could not list changes since '%s'", ref)
+        return None
+    return result.stdout.split()
+
+def _site_changed(site_conf: SiteConf, changed: list[str]) -> bool:
     """
-    Rollback a site to the previous release.
+    Check whether any changed path matches a site's ``paths`` patterns.
 
-    Identifies the most recent backup release and reverts to it.
+    :param site_conf: Typed site configuration.
+    :type site_conf: SiteConf
 
-    :param c: Fabric connection or context object.
-    :type c: Union[Connection, DockerRunner, Context]
+    :param changed: Paths reported by ``git diff``.
+    :type changed: list[str]
 
-    :param site: Name of the site to rollback.
-    :type site: str
+    :return: True if the site is affected by the changes.
+    :rtype: bool
     """
-    # Initialize logger
-    logger = get_logger(site)
+    patterns = dict(site_conf.extra).get("paths", [])
+    return any(
+        fnmatch.fnmatch(path, pattern)
+        for path in changed
+        for pattern in patterns
+    )
+
+def _select_sites(
+    sites: dict[str, SiteConf],
+    only: str = "",
+    exclude: str = "",
+    changed_since: str = ""
+) -> list[str] | None:
+    """
+    Pick the sites an *_all task should process.
 
-    # Load site definitions
-    sites = load_sites()
+    :param sites: Typed configuration of each site, keyed by site name.
+    :type sites: dict[str, SiteConf]
 
-    # Exit if the site doesn't exist
-    if site not in sites:
-        logger.error(f"Site '{site}' not found in sites.yml.")
-        return
+    :param only: Comma-separated names of the only sites to process.
+    :type only: str
 
-    # Extract config and set site name
-    config = sites[site]
-    config['name'] = site
+    :param exclude: Comma-separated names of sites to skip.
+    :type exclude: str
 
-    # Resolve connection using environment vars if present
-    c = get_connection(c, config = config)
-    # Log and execute rollback
-    logger.info(f"Rolling back site: {site}")
-    rollback_to_previous_release(c, config)
+    :param changed_since: Git ref; keep only sites whose ``paths``
+            match a file changed since it.
+    :type changed_since: str
 
-@task
-def rollback_all(c: Connection | DockerRunner | Context) -> None:
+    :return: Selected site names, or None if the changes could not be
+            listed.
+    :rtype: list[str] or None
     """
-    Rollback all sites to their previous releases.
+    selected = list(sites)
+
+    # Keep only the requested sites, warning about unknown names
+    if only:
+        wanted = _split_names(only)
+        for name in sorted(wanted - sites.keys()):
+            logger.warning("Site '%s' not found in sites.yml", name)
+        selected = [site for site in selected if site in wanted]
+
+    # Drop the excluded sites
+    if exclude:
+        skipped = _split_names(exclude)
+        selected = [site for site in selected if site not in skipped]
+
+    # Keep only the sites affected by recent changes
+    if changed_since:
+        changed = _changed_paths(changed_since)
+        if changed is None:
+            return None
+        selected = [
+            site for site in selected if _site_changed(sites[site], changed)
+        ]
+
+    return selected
+
+def _prepare_sites(
+    c: Connection | DockerRunner | Context,
+    only: str = "",
+    exclude: str = "",
+    changed_since: str = ""
+) -> list[tuple[str, dict, Logger, Connection | DockerRunner | Context]]:
+    """
+    Resolve config, logger and runner for every selected site.
 
-    Iterates through all configured sites and performs a rollback
-    to their last known good deployment.
+    Everything that does not change between iterations is computed
+    once here, so the *_all tasks only loop over ready-made tuples.
+    The filters are those accepted by `_select_sites`.
 
     :param c: Fabric connection or context object.
     :type c: Union[Connection, DockerRunner, Context]
-    """
-    # Load all site configs
-    sites = load_sites()
 
-    # Apply rollback to each one
-    for site, config in sites.items():
-        config['name'] = site
-        # Resolve connection using environment vars if present
-        c = get_connection(c, config = config)
-        logger = get_logger(site)
-        logger.info(f"Rolling back site: {site}")
-        rollback_to_previous_release(c, config)
+    :param only: Comma-separated names of the only sites to process.
+    :type only: str
+
+    :param exclude: Comma-separated names of sites to skip.
+    :type exclude: str
 
-@task(help={"site": "Name of the site to unlock"})
-def unlock(c: Connection | DockerRunner | Context, site: str) -> None:
+    :param changed_since: Git ref used to select changed sites.
+    :type changed_since: str
+
+    :return: Tuples of site name, config, logger and runner.
+    :rtype: list[tuple]
     """
-    Force-remove the deployment lock for a specific site.
+    # Load all site definitions and apply the filters
+    sites = _cached_load_sites()
+    selected = _select_sites(sites, only, exclude, changed_since)
+    if not selected:
+        if selected is not None:
+            logger.info("No sites selected.")
+        return []
+
+    # A global DEPLOYER_HOST applies to every site, resolve it once
+    env_conn = _connection_from_env()
+    base_conn = env_conn or get_connection(c)
+
+    prepared = []
+    for site in selected:
+        site_conf = sites[site]
+        conn = base_conn
+        # Only Docker or host-specific sites need their own runner
+        if env_conn is None and (
+            site_conf.host is not None or site_conf.runner == "docker"
+        ):
+            conn = get_connection(c, site = site_conf)
+        prepared.append(
+            (site, site_conf.to_dict(), get_logger(site), conn)
+        )
 
-    Useful when a previous deployment was interrupted and the
-    lock wasn't released.
+    return prepared
 
-    :param c: Fabric connection or context object.
-    :type c: Union[Connection, DockerRunner, Context]
+def _load_action(target: str) -> Callable:
+    """
+    Import the recipe behind a task only when the task runs.
 
-    :param site: Name of the site to unlock.
-    :type site: str
+    :param target: Dotted path in ``module:function`` form.
+    :type target: str
+
+    :return: The recipe function.
+    :rtype: Callable
+    """
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+def _make_single(
+    name: str,
+    target: str,
+    message: str,
+    doc: str,
+    *,
+    site_lock: bool = True,
+    **kwargs: object
+) -> Task:
     """
-    # Initialize logger
-    logger = get_logger(site)
+    Build a task that runs a recipe against one site.
 
-    # Load available sites
-    sites = load_sites()
+    :param name: Task name exposed to the Fabric CLI.
+    :type name: str
 
-    # Validate site presence
-    if site not in sites:
-        logger.error(f"Site '{site}' not found in sites.yml.")
-        return
+    :param target: Recipe in ``module:function`` form.
+    :type target: str
 
-    # Set site name and perform unlock
-    config = sites[site]
-    config['name'] = site
+    :param message: Log message written before the recipe runs.
+    :type message: str
 
-    # Resolve connection using environment vars if present
-    c = get_connection(c, config = config)
+    :param doc: Docstring shown by ``fab2 --help``.
+    :type doc: str
 
-    logger.info(f"Unlocking site: {site}")
-    release_lock(c, config, force=True)
+    :param site_lock: Whether to hold the local site lock while the
+            recipe runs.
+    :type site_lock: bool
 
-@task
-def unlock_all(c: Connection | DockerRunner | Context) -> None:
+    :param kwargs: Extra keyword arguments passed to the recipe.
+    :type kwargs: dict
+
+    :return: The Fabric task.
+    :rtype: Task
     """
-    Remove lock files for all sites defined in ``sites.yml``.
+    def body(c: Connection | DockerRunner | Context, site: str) -> None:
+        prepared = _prepare_single(c, site)
+        if prepared is None:
+            return
+
+        # Log and execute the recipe, holding the site lock if required
+        config, logger, conn = prepared
+        with (
+            _site_lock(config["name"], logger)
+            if site_lock
+            else contextlib.nullcontext()
+        ):
+            logger.info("%s: %s", message, config["name"])
+            _load_action(target)(conn, config, **kwargs)
+
+    body.__name__ = body.__qualname__ = name
+    body.__doc__ = doc
+    action = name.partition("_")[0]
+    return task(help={"site": f"Name of the site to {action}"})(body)
+
+def _make_all(name: str, target: str, message: str, doc: str) -> Task:
+    """
+    Build a task that runs a recipe against every configured site.
 
-    Useful when recovering from interrupted deploys or rollbacks.
+    :param name: Task name exposed to the Fabric CLI.
+    :type name: str
 
-    :param c: Fabric connection or context object.
-    :type c: Union[Connection, DockerRunner, Context]
+    :param target: Recipe in ``module:function`` form.
+    :type target: str
+
+    :param message: Log message written before each site is processed.
+    :type message: str
+
+    :param doc: Docstring shown by ``fab2 --help``.
+    :type doc: str
+
+    :return: The Fabric task.
+    :rtype: Task
     """
-    # Load site configurations
-    sites = load_sites()
+    def body(
+        c: Connection | DockerRunner | Context,
+        only: str = "",
+        exclude: str = "",
+        changed_since: str = ""
+    ) -> None:
+        # Process each selected site concurrently
+        _run_parallel(
+            _prepare_sites(c, only, exclude, changed_since),
+            _load_action(target),
+            message
+        )
 
-    # Unlock each one using force
-    for site, config in sites.items():
-        config['name'] = site
-        # Resolve connection if needed
-        c = get_connection(c, config = config)
-        logger = get_logger(site)
-        logger.info(f"Unlocking site: {site}")
-        release_lock(c, config, force=True)
+    body.__name__ = body.__qualname__ = name
+    body.__doc__ = doc
+    return task(help=_FILTER_HELP)(body)
 
-@task(help={"site": "Name of the site to restart"})
-def restart_site(c: Connection | DockerRunner | Context, site: str) -> None:
+deploy = _make_single(
+    "deploy",
+    "fabricator.deploy:deploy_site",
+    "Deploying site",
     """
-    Restart a single site defined in the configuration file.
+    Deploy a single site defined in the configuration file.
 
     Loads site-specific configuration, resolves the proper connection
     (local, Docker, or SSH), and runs the full deployment process.
+    """
+)
+
+deploy_all = _make_all(
+    "deploy_all",
+    "fabricator.deploy:deploy_site",
+    "Deploying site",
+    """
+    Deploy all sites listed in the configuration file.
+
+    Iterates through all entries in ``sites.yml`` and runs the
+    deployment pipeline for each one, several sites at a time.
+    """
+)
+
+@task
+def list_sites(c: Connection | DockerRunner | Context) -> None:
+    """
+    Display all configured sites and their repository URLs.
+
+    Loads site data from ``sites.yml`` and prints the site name
+    alongside its associated Git repository.
 
     :param c: Fabric connection or context object.
     :type c: Union[Connection, DockerRunner, Context]
-
-    :param site: Name of the site as defined in ``sites.yml``.
-    :type site: str
     """
-    # Load all site definitions from the YAML config
-    sites = load_sites()
+    # Print table of available site names, reusing the parsed sites file
+    print_site_list({
+        name: site_conf.to_dict()
+        for name, site_conf in _cached_load_sites().items()
+    })
+
+rollback = _make_single(
+    "rollback",
+    "fabricator.recipes:rollback_to_previous_release",
+    "Rolling back site",
+    """
+    Rollback a site to the previous release.
 
-    # Initialize logger for the given site
-    logger = get_logger(site)
+    Identifies the most recent backup release and reverts to it.
+    """
+)
 
-    # Abort if the requested site does not exist in config
-    if site not in sites:
-        logger.error(f"Site '{site}' not found in sites.yml")
-        return
+rollback_all = _make_all(
+    "rollback_all",
+    "fabricator.recipes:rollback_to_previous_release",
+    "Rolling back site",
+    """
+    Rollback all sites to their previous releases.
 
-    # Load config and set the site name explicitly
-    config = sites[site]
-    config['name'] = site
+    Iterates through all configured sites and performs a rollback
+    to their last known good deployment.
+    """
+)
 
-    # Resolve connection using environment vars if present
-    c = get_connection(c, config = config)
+unlock = _make_single(
+    "unlock",
+    "fabricator.recipes:release_lock",
+    "Unlocking site",
+    """
+    Force-remove the deployment lock for a specific site.
 
-    restart_services(c, config)
+    Useful when a previous deployment was interrupted and the
+    lock wasn't released.
+    """,
+    # Must not wait for the run it is meant to recover from
+    site_lock=False,
+    force=True
+)
 
-@task
-def restart_all(c: Connection | DockerRunner | Context) -> None:
+@task(help=_FILTER_HELP)
+def unlock_all(
+    c: Connection | DockerRunner | Context,
+    only: str = "",
+    exclude: str = "",
+    changed_since: str = ""
+) -> None:
     """
-    Restart all sites listed in the configuration file.
+    Remove lock files for all sites defined in ``sites.yml``.
 
-    Iterates through all entries in ``sites.yml`` and runs the
-    deployment pipeline for each one sequentially.
+    Useful when recovering from interrupted deploys or rollbacks.
 
     :param c: Fabric connection or context object.
     :type c: Union[Connection, DockerRunner, Context]
+
+    :param only: Comma-separated names of the only sites to unlock.
+    :type only: str
+
+    :param exclude: Comma-separated names of sites to skip.
+    :type exclude: str
+
+    :param changed_since: Git ref used to select changed sites.
+    :type changed_since: str
     """
-    # Load all site definitions
-    sites = load_sites()
+    # Group sites by runner so each host gets a single unlock command
+    batches = {}
+    targets = _prepare_sites(c, only, exclude, changed_since)
+    for site, config, logger, conn in targets:
+        batches.setdefault(id(conn), (conn, []))[1].append(
+            (site, config, logger)
+        )
 
-    # Deploy each site iteratively
-    for site, config in sites.items():
-        config['name'] = site
-        # Use remote connection if available from environment
-        c = get_connection(c, config = config)
-        logger = get_logger(site)
-        logger.info(f"Restarting site: {site}")
-        restart_services(c, config)
+    # Force-remove the lock files of each group with a single rm, and
+    # report each site only once the command has run
+    for conn, group in batches.values():
+        for site, _config, logger in group:
+            logger.info("Unlocking site: %s", site)
+        lock_files = " ".join(
+            shlex.quote(os.path.join(config["deploy_path"], ".deploy.lock"))
+            for _site, config, _logger in group
+        )
+        result = conn.run(f"rm -f {lock_files}", warn=True)
+        for site, _config, logger in group:
+            if result is None or result.failed:
+                logger.error("Could not unlock site: %s", site)
+            else:
+                logger.info("Deployment lock forcibly released.")
+
+restart_site = _make_single(
+    "restart_site",
+    "fabricator.recipes:restart_services",
+    "Restarting site",
+    """
+    Restart the services of a single site.
+
+    Loads site-specific configuration, resolves the proper connection
+    (local, Docker, or SSH), and restarts the site's services.
+    """
+)
+
+restart_all = _make_all(
+    "restart_all",
+    "fabricator.recipes:restart_services",
+    "Restarting site",
+    """
+    Restart the services of all configured sites.
+
+    Iterates through all entries in ``sites.yml`` and restarts each
+    site's services, several sites at a time.
+    """
+)
 
 # This line exposes the tasks to the Fabric CLI (`fab2 ...`)
 ns = Collection(
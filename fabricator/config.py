@@ -0,0 +1,90 @@
+"""
+Module for typed site configuration.
+
+This module provides an immutable view of a site entry from
+``sites.yml``, built once when the file is loaded.
+
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+# Keys every site must define to be deployed
+REQUIRED_KEYS = ("repository", "deploy_path")
+
+
+@dataclass(frozen=True, slots=True)
+class SiteConf:
+
+    """
+    Immutable configuration of a single site.
+
+    The settings that decide how to reach the site are exposed as typed
+    attributes. The full YAML entry is kept in ``extra`` so recipes can
+    still receive a plain dictionary through `to_dict`.
+    """
+
+    name: str
+    host: str | None = None
+    port: int = 22
+    runner: str | None = None
+    docker_container: str | None = None
+    docker_user: str = "root"
+    # Not part of equality or hash: values may be lists or mappings,
+    # and the connection target is fully described by the fields above
+    extra: tuple[tuple[str, Any], ...] = field(
+        default=(), compare=False, hash=False
+    )
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "SiteConf":
+        """
+        Build a site configuration from its ``sites.yml`` entry.
+
+        :param name: Name of the site as defined in ``sites.yml``.
+        :type name: str
+
+        :param data: Raw settings of the site.
+        :type data: dict
+
+        :return: The typed site configuration.
+        :rtype: SiteConf
+        """
+        return cls(
+            name=name,
+            host=data.get("host"),
+            port=data.get("port", 22),
+            runner=data.get("runner"),
+            docker_container=data.get("docker_container"),
+            docker_user=data.get("docker_user", "root"),
+            extra=tuple(data.items())
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Return a fresh, mutable copy of the settings for the recipes.
+
+        The deployment pipeline rewrites keys such as ``deploy_path``,
+        so each call returns a new dictionary.
+
+        :return: Site settings including the ``name`` key.
+        :rtype: dict
+        """
+        config = dict(self.extra)
+        config["name"] = self.name
+        return config
+
+    def missing_keys(self) -> list[str]:
+        """
+        List the settings the site needs but does not define.
+
+        Besides `REQUIRED_KEYS`, Docker sites need ``docker_container``.
+
+        :return: Names of the missing keys, empty if the site is valid.
+        :rtype: list[str]
+        """
+        config = dict(self.extra)
+        missing = [key for key in REQUIRED_KEYS if not config.get(key)]
+        if self.runner == "docker" and not self.docker_container:
+            missing.append("docker_container")
+        return missing
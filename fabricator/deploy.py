@@ -6,6 +6,10 @@ Fabric, including deployment steps, lock management, and rollback
 mechanisms.
 
 """
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import UTC, datetime
+
 from fabric2 import Connection
 from invoke.context import Context
 
@@ -18,6 +22,7 @@ from fabricator.recipes import (
     collect_static,
     create_backup,
     deploy_to_release_folder,
+    get_current_release,
     install_deps,
     migrate,
     release_lock,
@@ -28,8 +33,99 @@ from fabricator.recipes import (
     symlink_release_to_current,
     update_code,
 )
-from fabricator.runners import DockerRunner
+from fabricator.runners import DockerRunner, open_transport
+
+# Steps run once the release folder exists, with the steps each one
+# depends on: permissions apply to the linked shared folders, Django
+# commands need the installed dependencies (and the shared `.env`)
+POST_RELEASE_STEPS = {
+    shared_files: (),
+    set_writable_dirs: (shared_files,),
+    install_deps: (shared_files,),
+    migrate: (install_deps,),
+    collect_static: (install_deps,),
+}
+
+# Maximum number of steps of the same deployment run at once
+MAX_PARALLEL_STEPS = 4
+
+def run_step_graph(
+    c: Connection | DockerRunner | Context,
+    config: dict,
+    graph: dict[Callable, tuple[Callable, ...]]
+) -> None:
+    """
+    Run deployment steps as soon as the steps they depend on are done.
+
+    Independent steps run in threads sharing the same runner: an SSH
+    transport multiplexes one channel per command, so no extra
+    connection is opened. If a step fails, the steps already running
+    are awaited, no new step is started, and the error is re-raised
+    (a `DeployerException` first, if several steps failed).
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :param graph: Each step mapped to the steps it depends on.
+    :type graph: dict[Callable, tuple[Callable, ...]]
+
+    :raises DeployerException: If any step fails.
+    """
+    pending = dict(graph)
+    running = {}
+    done = set()
+    errors = []
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS) as executor:
+        while running or (pending and not errors):
+            # Start every step whose dependencies have completed, unless
+            # a step already failed
+            for step, deps in list(pending.items()):
+                if not errors and done.issuperset(deps):
+                    running[executor.submit(step, c, config)] = step
+                    del pending[step]
+
+            # Wait for the next step to finish, collecting failures
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                if future.exception():
+                    errors.append(future.exception())
+                else:
+                    done.add(step)
+
+    # A deployment error takes precedence, as it triggers the rollback
+    if errors:
+        raise next(
+            (e for e in errors if isinstance(e, DeployerException)),
+            errors[0]
+        )
+
+def scope_to_release(config: dict, release_path: str) -> dict:
+    """
+    Build the configuration seen by the steps run inside a release.
+
+    The recipes after the release is created expect ``deploy_path`` to
+    be the release folder and ``original_path`` the site root. They get
+    a shallow copy with both set, so the site configuration itself is
+    never modified.
+
+    :param config: Site configuration dictionary.
+    :type config: dict
 
+    :param release_path: Absolute path of the new release folder.
+    :type release_path: str
+
+    :return: Configuration scoped to the release.
+    :rtype: dict
+    """
+    return {
+        **config,
+        "original_path": config["deploy_path"],
+        "deploy_path": release_path,
+    }
 
 def deploy_site(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
@@ -78,14 +174,22 @@ def deploy_site(c: Connection | DockerRunner | Context, config: dict) -> None:
     msg = f"Starting deployment for '{config['name']}' on '{host}'"
     logger.info(msg)
     lock_id = None
-    release_path = None
-    original_path = None
+    release_config = None
     try:
-        # Step 0: Acquire lock to prevent concurrent deployments
+        # Step 0: Validate the configuration before touching the target
+        check_remote(c, config)
+
+        # One timestamp names the lock, backup and release of this deploy
+        config["started_at"] = datetime.now(UTC)
+
+        # Open the SSH transport once, every step below reuses it
+        open_transport(c)
+
+        # Step 1: Acquire lock to prevent concurrent deployments
         lock_id = acquire_lock(c, config)
 
-        # Step 1: Ensure the remote deployment directory exists
-        check_remote(c, config)
+        # Remember the live release so a rollback can restore it directly
+        config["previous_release"] = get_current_release(c, config)
 
         # Step 2: Create a compressed backup of the current state
         create_backup(c, config)
@@ -93,39 +197,25 @@ def deploy_site(c: Connection | DockerRunner | Context, config: dict) -> None:
         # Step 3: Clone the repository into a temporary folder
         update_code(c, config)
 
-        # Step 4: Move code into timestamped release folder and update symlink
-        original_path = config["deploy_path"]
-        config["original_path"] = original_path
+        # Step 4: Move code into timestamped release folder
         release_path = deploy_to_release_folder(c, config)
-        config["deploy_path"] = release_path
 
-        # Step 5: Clean up old releases, keeping only the most recent ones
-        max_releases = config.get("max_releases", 5)
-        cleanup_old_releases(c, config, keep=max_releases)
-
-        # Step 6: Switch deployment path to the new release folder
-        config["deploy_path"] = release_path
-
-        # Step 7: Symlink shared files and folders (e.g., `.env`, `media/`)
-        shared_files(c, config)
+        release_config = scope_to_release(config, release_path)
 
-        # Step 8: Set write permissions on defined folders (e.g., 775)
-        set_writable_dirs(c, config)
-
-        # Step 9: Install dependencies inside the virtual environment
-        install_deps(c, config)
-
-        # Step 10: Validate and run Django database migrations
-        migrate(c, config)
+        # Step 5: Clean up old releases, keeping only the most recent
+        max_releases = config.get("max_releases", 5)
+        cleanup_old_releases(c, release_config, keep=max_releases)
 
-        # Step 11: Run Django's collectstatic to prepare static files
-        collect_static(c, config)
+        # Steps 7-11: Link shared files, set permissions, install
+        # dependencies, migrate and collect static files, running the
+        # steps that do not depend on each other concurrently
+        run_step_graph(c, release_config, POST_RELEASE_STEPS)
 
         # Step 12: Symlink the release to the current symlink
-        symlink_release_to_current(c, config)
+        symlink_release_to_current(c, release_config)
 
         # Step 13: Restart Gunicorn or other services to reflect changes
-        restart_services(c, config)
+        restart_services(c, release_config)
 
         # Deployment completed successfully
         msg = f"Deployment for '{config['name']}' completed successfully."
@@ -133,16 +223,17 @@ def deploy_site(c: Connection | DockerRunner | Context, config: dict) -> None:
 
     except DeployerException as e:
         # Log the deployment error
-        logger.error(f"Deployment failed: {e}")
-        if release_path:
+        logger.error("Deployment failed: %s", e)
+        if release_config:
             # If the release was created, rollback to previous working release
             logger.info("Rolling back to previous release...")
-            rollback_to_previous_release(c, config)
+            rollback_to_previous_release(c, release_config)
 
     finally:
         # Always release the lock regardless of success or failure
         if lock_id:
-            config["deploy_path"] = original_path if (
-                original_path
-            ) else config["deploy_path"]
-            release_lock(c, config, lock_id)
+            # A failure here must not hide the error of the deploy itself
+            try:
+                release_lock(c, config, lock_id)
+            except Exception as e:
+                logger.error("Could not release the deployment lock: %s", e)
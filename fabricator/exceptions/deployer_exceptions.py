@@ -25,17 +25,21 @@ class DeployerException(Exception):
         self.params = params
         super().__init__(message)
 
+        # Format once, the message is logged and printed several times
+        if code is not None:
+            self._str = f"[Fabricator Deployer] Error {code}: {message}"
+        else:
+            self._str = f"[Fabricator Deployer] {message}"
+
     def __str__(self):
         """
         Return a formatted string representation of the error.
 
         If a code is provided, it is included in the output. Otherwise,
-        only the message is shown.
+        only the message is shown. The string is built once, when the
+        exception is created.
 
         :return: A string representing the error.
         :rtype: str
         """
-        if self.code is not None:
-            return f"[Fabricator Deployer] Error {self.code}: {self.message}"
-        else:
-            return f"[Fabricator Deployer] {self.message}"
+        return self._str
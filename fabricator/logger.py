@@ -6,16 +6,108 @@ from any module. It ensures that handlers are added only once to avoid
 duplicate logs.
 
 """
+import atexit
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
+# Skip record fields the log format never prints
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+
+class CachedFormatter(logging.Formatter):
+
+    """
+    Formatter reusing the formatted timestamp within the same second.
+
+    Bursts of records (e.g. several sites logging at once) share one
+    ``strftime`` call per second; only the milliseconds are appended
+    per record.
+    """
+
+    def __init__(self, fmt: str | None = None):
+        """
+        Initialize a new CachedFormatter instance.
+
+        :param fmt: Log record format string.
+        :type fmt: str or None
+        """
+        super().__init__(fmt)
+
+        # Last formatted second, stored as one tuple so threads always
+        # read a consistent pair
+        self._cached_second: tuple[int, str] = (-1, "")
+
+    def formatTime(  # noqa: N802
+        self,
+        record: logging.LogRecord,
+        datefmt: str | None = None
+    ) -> str:
+        """
+        Format the creation time of a record, as `logging.Formatter`.
+
+        :param record: Log record being formatted.
+        :type record: logging.LogRecord
+
+        :param datefmt: Optional ``strftime`` format; disables caching.
+        :type datefmt: str or None
+
+        :return: Formatted timestamp with milliseconds.
+        :rtype: str
+        """
+        if datefmt:
+            return super().formatTime(record, datefmt)
+
+        second = int(record.created)
+        cached_second, text = self._cached_second
+        if second != cached_second:
+            text = time.strftime(
+                self.default_time_format, self.converter(record.created)
+            )
+            self._cached_second = (second, text)
+        return self.default_msec_format % (text, record.msecs)
+
+# Formatter shared by every logger, so they also share its cache
+_FORMATTER = CachedFormatter("%(asctime)s [%(levelname)s] %(message)s")
+
+# Loggers already configured, keyed by name
+_LOGGERS: dict[str, logging.Logger] = {}
+
+# Records queued by every logger, written to the console by one thread
+_QUEUE: queue.SimpleQueue = queue.SimpleQueue()
+_LISTENER: QueueListener | None = None
+_LISTENER_LOCK = threading.Lock()
+
+def _start_listener() -> None:
+    """
+    Start the thread writing queued records to the console, once.
+
+    Logging calls only enqueue records, so slow output (redirected to a
+    file, piped to another program) never blocks a deploy. The queue is
+    drained when the process exits.
+    """
+    global _LISTENER  # noqa: PLW0603
+    with _LISTENER_LOCK:
+        if _LISTENER is not None:
+            return
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(_FORMATTER)
+        _LISTENER = QueueListener(_QUEUE, console_handler)
+        _LISTENER.start()
+        atexit.register(_LISTENER.stop)
 
 def get_logger(name: str = "deploy") -> logging.Logger:
     """
     Get or create a reusable console-based logger by name.
 
-    This function returns a configured `logging.Logger` instance with
-    an attached console handler. It prevents duplication of handlers
-    if the logger is requested multiple times.
+    This function returns a configured `logging.Logger` instance whose
+    records are written to the console by a background thread. It
+    prevents duplication of handlers if the logger is requested
+    multiple times.
 
     The logger outputs messages in the format:
     `[timestamp] [LEVEL] message`.
@@ -27,19 +119,23 @@ def get_logger(name: str = "deploy") -> logging.Logger:
     :return: A configured `Logger` object ready for use.
     :rtype: logging.Logger
     """
+    # Skip the logging manager lock once the logger is configured
+    logger = _LOGGERS.get(name)
+    if logger is not None:
+        return logger
+
     logger = logging.getLogger(name)
 
     # Avoid adding multiple handlers on repeated calls
     if logger.hasHandlers():
+        _LOGGERS[name] = logger
         return logger
 
     logger.setLevel(logging.INFO)
 
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-
-    # Console handler only
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    # Console output only, written by the shared listener thread
+    _start_listener()
+    logger.addHandler(QueueHandler(_QUEUE))
 
+    _LOGGERS[name] = logger
     return logger
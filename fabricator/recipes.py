@@ -1,4 +1,3 @@
-# ruff: noqa: C901
 """
 Module for deployment recipes.
 
@@ -9,24 +8,198 @@ checking remote systems, updating code, creating backups, and more.
 """
 import getpass
 import os
+import shlex
 import uuid
 from datetime import UTC, datetime
 
 from fabric2 import Connection
 from invoke.context import Context
 
+from fabricator.config import SiteConf
 from fabricator.exceptions.deployer_exceptions import DeployerException
 from fabricator.logger import get_logger
-from fabricator.runners import DockerRunner
+from fabricator.runners import BatchingRunner, DockerRunner
 
+# User who initiated the deployment, recorded in the lock file
+LOCAL_USER = (
+    os.environ.get("USER") or os.environ.get("LOGNAME") or getpass.getuser()
+)
+
+# Entries of the deploy path that update_code never deletes
+KEEP_NAMES = (
+    "env", "__clone_tmp__", "repo.git", "releases", "current", ".deploy.lock",
+    ".pip-cache"
+)
+
+# `find` expression matching KEEP_NAMES, built once
+KEEP_NAMES_EXPR = " -o ".join(f"-name '{name}'" for name in KEEP_NAMES)
+
+def started_at(config: dict) -> datetime:
+    """
+    Return the instant the deploy started, used to name its artifacts.
+
+    `deploy_site` stores it once in ``started_at`` so the lock, the
+    backup and the release of the same deploy share one timestamp.
+    Recipes called on their own fall back to the current time.
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :return: Start time of the deploy, in UTC.
+    :rtype: datetime
+    """
+    return config.get("started_at") or datetime.now(UTC)
+
+def hash_marker(target: str) -> str:
+    """
+    Name the file storing the inputs hash of a generated directory.
+
+    The marker lives at the top of the release, so slashes in ``target``
+    (e.g. ``static/collected`` or an absolute path) are flattened.
+
+    :param target: Generated directory, relative to the release.
+    :type target: str
+
+    :return: File name of the marker, relative to the release.
+    :rtype: str
+    """
+    return f".{target.strip('/').replace('/', '_')}_hash"
+
+def ensure_dir_command(path: str, mode: str = "") -> str:
+    """
+    Build a command creating a directory owned by the remote user.
+
+    Nothing runs when the directory already exists. Otherwise it is
+    created with `sudo` and handed over to the user running the command,
+    so a single command replaces the usual probe, `whoami`, `mkdir` and
+    `chown` round trips. Compound commands need a shell, so queue it in
+    a `BatchingRunner` batch (or wrap it in ``bash -c``).
+
+    :param path: Directory to create.
+    :type path: str
+
+    :param mode: Optional mode passed to `chmod` on creation.
+    :type mode: str
+
+    :return: Shell command ensuring the directory exists.
+    :rtype: str
+    """
+    chmod = f" && sudo chmod {mode} {path}" if mode else ""
+    return (
+        f"[ -d {path} ] || {{ sudo mkdir -p {path}{chmod} && "
+        f"sudo chown \"$(whoami):$(whoami)\" {path}; }}"
+    )
+
+def newest_first_command(path: str) -> str:
+    """
+    Build a command listing the directories inside a path, newest first.
+
+    `find` prints each modification time next to its path, so the list
+    is sorted without spawning `ls` or expanding a glob in the shell.
+
+    :param path: Directory whose subdirectories are listed.
+    :type path: str
+
+    :return: Shell command printing one directory per line.
+    :rtype: str
+    """
+    return (
+        f"find {path} -mindepth 1 -maxdepth 1 -type d -printf '%T@ %p\\n' "
+        f"| sort -rn | cut -d ' ' -f 2-"
+    )
+
+def swap_symlink_command(target: str, link: str) -> str:
+    """
+    Build a command pointing a symlink to a new target atomically.
+
+    ``ln -sfn`` removes the old link before creating the new one, so
+    for a moment the link does not exist. The new link is created next
+    to it instead and renamed over it, which readers see as one change.
+
+    :param target: Path the symlink must point to.
+    :type target: str
+
+    :param link: Symlink to update.
+    :type link: str
+
+    :return: Shell command replacing the symlink.
+    :rtype: str
+    """
+    return f"ln -sfn {target} {link}.new && mv -Tf {link}.new {link}"
+
+def probe_paths(
+        c: Connection | DockerRunner | Context,
+        *paths: str
+    ) -> dict[str, str]:
+    """
+    Report the file type of several paths with a single command.
+
+    Only POSIX ``test`` operators are used, so the probe works with any
+    ``sh``. Symbolic links are not followed, unless the path ends with
+    ``/``.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param paths: Paths to inspect.
+    :type paths: tuple[str, ...]
+
+    :return: Type of each path: ``symbolic link``, ``directory``,
+            ``regular file``, ``other`` or ``missing``.
+    :rtype: dict[str, str]
+    """
+    result = c.run(
+        "; ".join(
+            f"if [ -L {q} ]; then echo 'symbolic link'; "
+            f"elif [ -d {q} ]; then echo directory; "
+            f"elif [ -f {q} ]; then echo 'regular file'; "
+            f"elif [ -e {q} ]; then echo other; "
+            f"else echo missing; fi"
+            for q in map(shlex.quote, paths)
+        ),
+        hide=True,
+        warn=True
+    )
+    kinds = result.stdout.splitlines() if result is not None else []
+    return {
+        path: kinds[i] if i < len(kinds) else "missing"
+        for i, path in enumerate(paths)
+    }
+
+def run_script(
+        c: Connection | DockerRunner | Context,
+        script: str,
+        **kwargs
+    ) -> object:
+    """
+    Run a multi-line shell script as a single remote command.
+
+    The script is quoted into ``bash -c`` rather than piped through
+    stdin, so it also works with runners that do not forward input,
+    such as `DockerRunner`.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param script: Bash script, one command per line.
+    :type script: str
+
+    :param kwargs: Extra arguments passed to ``run`` (e.g. ``warn``).
+    :type kwargs: dict
+
+    :return: Result of the command.
+    :rtype: Result
+    """
+    return c.run(f"bash -c {shlex.quote(script)}", **kwargs)
 
 def check_remote(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     Validate the configuration and runner for a deployment site.
 
     Ensures that mandatory keys like `repository` and `deploy_path`
-    exist in the configuration. Raises an exception if required fields
-    are missing or misconfigured.
+    exist in the configuration (see `SiteConf.missing_keys`). Raises an
+    exception if required fields are missing or misconfigured. No
+    command is run, so it is safe to call before connecting.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -38,14 +211,8 @@ def check_remote(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     logger = get_logger(config['name'])
 
-    # List of required configuration keys for deployment
-    required_keys = ['repository', 'deploy_path']
-
-    # Detect runner type to apply extra validation
-    runner = config.get("runner", "local")
-
-    # Check for missing required config keys
-    missing = [key for key in required_keys if not config.get(key)]
+    # Check every required key at once, including runner-specific ones
+    missing = SiteConf.from_dict(config['name'], config).missing_keys()
 
     # If any required keys are missing, raise an error
     if missing:
@@ -53,18 +220,21 @@ def check_remote(c: Connection | DockerRunner | Context, config: dict) -> None:
         msg_raise = f"Invalid configuration for site '{config['name']}'."
         raise DeployerException(msg_raise)
 
-    # For Docker runner, ensure 'docker_container' is defined
-    if runner == "docker" and not config.get("docker_container"):
-        logger.error("Missing 'docker_container' for Docker-based runner.")
-        msg_raise = f"Invalid configuration for Docker site '{config['name']}'"
-        raise DeployerException(msg_raise)
-
 def update_code(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
-    Clone the repository into a temporary directory.
-
-    Removes all files in the deployment path except essential ones,
-    creates a temporary folder, and performs a fresh `git clone` into it.
+    Export the repository into a temporary directory.
+
+    Removes all files in the deployment path except essential ones and
+    creates a temporary folder. By default only the tip of the branch is
+    fetched with a fresh shallow `git clone`, which keeps a `.git`
+    folder in the release; set ``full_clone: true`` to clone the whole
+    history instead. With ``git_mirror: true`` the code comes from a bare
+    mirror kept at ``repo.git`` in the deployment path: it is cloned on
+    the first deploy and only fetched afterwards, and the branch is
+    exported with `git archive`. Such releases have no `.git` folder
+    (the deployed commit is written to `REVISION`) and no submodules,
+    so it does not suit projects relying on `git describe`,
+    `setuptools_scm` or submodules.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -74,42 +244,69 @@ def update_code(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     logger = get_logger(config['name'])
 
-    # Use the specified branch or fall back to 'main'
-    branch = config.get("branch", "main")
+    # Use the specified branch or fall back to 'main'; both values are
+    # free-form, so they are quoted for the shell
+    branch = shlex.quote(config.get("branch", "main"))
 
     # Get repository URL and deployment path
-    repo = config["repository"]
+    repo = shlex.quote(config["repository"])
     deploy_path = config["deploy_path"]
 
-    # Define the temporary clone directory
+    # Define the temporary clone directory and the persistent mirror
     tmp_clone = f"{deploy_path}/__clone_tmp__"
+    mirror = f"{deploy_path}/repo.git"
 
-    # Clean old files but keep essential folders (env, releases, lock)
+    # The steps below run as one batch, so announce them all up front
+    use_mirror = config.get("git_mirror", False)
     logger.info("Cleaning old files in deploy path (excluding env and "
                 "__clone_tmp__)...")
-    c.run(
-        f"find {deploy_path} -mindepth 1 -maxdepth 1 "
-        f"! -name 'env' ! -name '__clone_tmp__' "
-        f"! -name 'releases' ! -name 'current' ! -name '.deploy.lock' "
-        f"-exec rm -rf {{}} +",
-        warn=True
-    )
-
-    # Remove any previous temporary clone if exists
     logger.info("Removing any previous temporary clone...")
-    c.run(f"rm -rf {tmp_clone}", warn=True)
+    if use_mirror:
+        logger.info("Updating repository mirror...")
+
+    # Clean old files but keep essential folders (env, releases, lock)
+    with BatchingRunner(c).batch() as b:
+        # Entries are removed by parallel rm processes, one per core
+        b.run(
+            f"find {deploy_path} -mindepth 1 -maxdepth 1 "
+            f"! \\( {KEEP_NAMES_EXPR} \\) "
+            f"-print0 | xargs -0 -r -n 1 -P \"$(nproc)\" rm -rf --",
+            warn=True
+        )
 
-    # Create the temporary directory with sudo and assign permissions
-    remote_user = c.run("whoami", hide=True)
-    if remote_user:
-        remote_user = remote_user.stdout.strip()
-        c.sudo(f"mkdir -p {tmp_clone}")
-        c.sudo(f"chown {remote_user}:{remote_user} {tmp_clone}")
+        # Remove any previous temporary clone if exists
+        b.run(f"rm -rf {tmp_clone}", warn=True)
 
-    # Perform the actual git clone into the temporary directory
-    c.run(f"git clone --branch {branch} {repo} {tmp_clone}")
+        # Create the temporary directory with sudo and assign permissions
+        b.run(ensure_dir_command(tmp_clone))
+
+        if use_mirror:
+            # Fetch only new objects into the mirror, cloning it once
+            b.run(
+                f"if [ -d {mirror} ]; then "
+                f"git -C {mirror} fetch --prune; "
+                f"else git clone --mirror {repo} {mirror}; fi"
+            )
+            b.run(f"git -C {mirror} gc --auto", warn=True)
 
-    # Log confirmation that clone completed
+            # Export the branch, failing early if it does not exist
+            b.run(
+                f"git -C {mirror} rev-parse --verify {branch}^{{commit}} "
+                f"> {tmp_clone}/REVISION"
+            )
+            b.run(f"git -C {mirror} archive {branch} | tar -x -C {tmp_clone}")
+        else:
+            # Clone only the tip of the branch into the temporary
+            # directory, unless the site needs the history
+            shallow = (
+                "" if config.get("full_clone", False)
+                else "--depth=1 --single-branch "
+            )
+            b.run(
+                f"git clone {shallow}--branch {branch} {repo} {tmp_clone}"
+            )
+
+    # Log confirmation once the whole batch has run
     logger.info("Code cloned into temporary folder (not moved yet).")
 
 def shared_files(
@@ -142,68 +339,78 @@ def shared_files(
     shared_dir = os.path.join(config['deploy_path'], 'shared')
     release_dir = config['deploy_path']
 
-    # Ensure the shared directory exists
-    remote_user = c.run("whoami", hide=True)
-    if remote_user:
-        remote_user = remote_user.stdout.strip()
-        c.sudo(f"mkdir -p {shared_dir}")
-        c.sudo(f"chown {remote_user}:{remote_user} {shared_dir}")
+    # Prefixes of every shared element, joined once
+    shared_prefix = f"{shared_dir}/"
+    release_prefix = f"{release_dir}/"
+
+    # Build one script handling every shared element, so the whole step
+    # costs a single round trip
+    owner = "\"$(whoami):$(whoami)\""
+    commands = [
+        "status=0",
+        f"sudo mkdir -p {shared_dir} && sudo chown {owner} {shared_dir}"
+    ]
 
     # Handle shared files
     for file in shared_files:
-        shared_file = os.path.join(shared_dir, file)
-        release_file = os.path.join(release_dir, file)
-
-        # If a real file exists and is not a symlink, move it to shared
-        result = c.run(f"test -f {release_file} && [ ! -L {release_file} ]",
-                      warn=True)
-        if result and result.ok:
-            logger.warning(f"Moving existing file {file} to shared/")
-            c.run(f"mv {release_file} {shared_file}", warn=True)
-
-        # If the file doesn't exist in shared, create an empty one
-        result = c.run(f"test -f {shared_file}", warn=True)
-        if result and result.failed:
-            c.run(f"touch {shared_file}", warn=True)
-
-        # Create or update the symlink in the release directory
-        c.run(f"ln -sfn {shared_file} {release_file}", warn=True)
-        logger.info(f"Linked shared file: {file}")
+        shared_file = shlex.quote(shared_prefix + file)
+        release_file = shlex.quote(release_prefix + file)
+        moved = shlex.quote(f"file {file}")
+        commands += [
+            # If a real file exists and is not a symlink, move it to shared
+            f"if [ -f {release_file} ] && [ ! -L {release_file} ]; then "
+            f"mv {release_file} {shared_file} && echo {moved}; fi",
+            # If the file doesn't exist in shared, create an empty one
+            f"[ -f {shared_file} ] || touch {shared_file}",
+            # Create or update the symlink in the release directory
+            f"ln -sfn {shared_file} {release_file} || status=1"
+        ]
 
     # Handle shared directories
     for d in shared_dirs:
-        shared_subdir = os.path.join(shared_dir, d)
-        release_subdir = os.path.join(release_dir, d)
+        shared_subdir = shlex.quote(shared_prefix + d)
+        release_subdir = shlex.quote(release_prefix + d)
+        moved = shlex.quote(f"directory {d}")
+        commands += [
+            # If a real directory exists and is not a symlink, move it
+            f"if [ -d {release_subdir} ] && [ ! -L {release_subdir} ]; then "
+            f"mv {release_subdir} {shared_subdir} && echo {moved}; "
+            f"fi",
+            # If the shared directory doesn't exist, create it
+            f"[ -d {shared_subdir} ] || {{ sudo mkdir -p {shared_subdir} "
+            f"&& sudo chown {owner} {shared_subdir}; }}",
+            # Create or update the symlink in the release directory
+            f"ln -sfn {shared_subdir} {release_subdir} || status=1"
+        ]
+
+    # Keep going after a failure, but report it through the exit code
+    script = "\n".join([*commands, "exit $status"])
+    result = run_script(c, script, hide=True, warn=True)
+    if result is None or result.failed:
+        logger.warning("Some shared files or directories could not be linked.")
+    for moved in result.stdout.splitlines() if result is not None else []:
+        logger.warning(f"Moved existing {moved} to shared/")
 
-        # If a real directory exists and is not a symlink, move it
-        test_cmd = (
-            f"test -d {release_subdir} && "
-            f"[ ! -L {release_subdir} ]"
-        )
-        result = c.run(test_cmd, warn=True)
-        if result and result.ok:
-            logger.warning(f"Moving existing directory {d} to shared/")
-            c.run(f"mv {release_subdir} {shared_subdir}", warn=True)
-
-        # If the shared directory doesn't exist, create it
-        result = c.run(f"test -d {shared_subdir}", warn=True)
-        if result and result.failed:
-            remote_user = c.run("whoami", hide=True)
-            if remote_user:
-                remote_user = remote_user.stdout.strip()
-                c.sudo(f"mkdir -p {shared_dir}", warn=True)
-                c.sudo(f"chown {remote_user}:{remote_user} {shared_dir}")
-
-        # Create or update the symlink in the release directory
-        c.run(f"ln -sfn {shared_subdir} {release_subdir}", warn=True)
+    for file in shared_files:
+        logger.info(f"Linked shared file: {file}")
+    for d in shared_dirs:
         logger.info(f"Linked shared directory: {d}")
 
+# Printed by the install script to report what it found
+NO_REQUIREMENTS = "__NO_REQUIREMENTS__"
+SCRAPER_FOUND = "__SCRAPER_FOUND__"
+
 def install_deps(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     Install Python dependencies in a virtual environment.
 
     Creates a `venv` folder if it does not exist and installs packages
-    from `requirements.txt` using pip.
+    from `requirements.txt` using pip, with its cache kept in
+    `.pip-cache` at the site root (or only from ``wheelhouse`` when that
+    key is set). When the requirements did not
+    change, the virtualenv of the previous release is reused instead
+    (see `reuse_virtualenv`); set ``force_install_deps`` to always
+    run pip.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -216,44 +423,52 @@ def install_deps(c: Connection | DockerRunner | Context, config: dict) -> None:
     venv_path = config.get("venv", "venv")
     deploy_path = config["deploy_path"]
     venv_dir = f"{deploy_path}/{venv_path}"
-    requirements_file = f"{deploy_path}/requirements.txt"
-
-    # Check if virtualenv exists
-    logger.info("Checking if virtualenv exists...")
-    result = c.run(f"test -d {venv_dir}", warn=True)
-    if result is None or result.failed:
-        logger.info(f"Creating virtualenv at {venv_dir}")
-        c.run(f"python3 -m venv {venv_dir}")
 
-    # Check for requirements.txt before installing
-    result = c.run(f"test -f {requirements_file}", warn=True)
-    if result is None or result.failed:
+    # Skip pip entirely when the requirements did not change
+    save_hash = []
+    if not config.get("force_install_deps", False):
+        deps_hash, reused = reuse_virtualenv(c, config)
+        if reused:
+            logger.info("Requirements unchanged, reusing previous virtualenv.")
+            return
+        if deps_hash:
+            save_hash = [f"echo {deps_hash} > {hash_marker(venv_path)}"]
+
+    # Keep downloads and built wheels in the site root across releases,
+    # and install only from the wheelhouse when one is configured
+    site_path = config.get("original_path", deploy_path)
+    pip_args = (
+        f"--disable-pip-version-check --cache-dir {site_path}/.pip-cache"
+    )
+    wheelhouse = config.get("wheelhouse")
+    if wheelhouse:
+        pip_args += f" --no-index --find-links={shlex.quote(wheelhouse)}"
+
+    # Create the virtualenv, install the requirements and look for the
+    # scraper in one remote script. The pip install stays on a line of
+    # its own so that ``set -e`` aborts the script when it fails, and
+    # the hash is only saved once it succeeded
+    logger.info("Installing Python dependencies...")
+    result = run_script(c, "\n".join([
+        "set -e",
+        f"cd {deploy_path}",
+        f"[ -d {venv_dir} ] || python3 -m venv {venv_dir}",
+        f"[ -f requirements.txt ] || {{ echo {NO_REQUIREMENTS}; exit 0; }}",
+        f". {venv_dir}/bin/activate",
+        f"pip install {pip_args} --prefer-binary -r requirements.txt",
+        *save_hash,
+        f"python -c 'import apigateway_scraper' 2>/dev/null "
+        f"&& echo {SCRAPER_FOUND} || true"
+    ]))
+    output = result.stdout if result is not None else ""
+    if NO_REQUIREMENTS in output:
         logger.warning(
             "No requirements.txt found, skipping dependency install."
         )
         return
 
-    logger.info("Installing Python dependencies...")
-    c.run(
-        f"bash -c 'source {venv_dir}/bin/activate && "
-        f"cd {deploy_path} && "
-        f"pip install --prefer-binary -r requirements.txt'",
-        pty=True
-    )
-
     # Install Playwright browsers if apigateway_scraper is installed
-    logger.info("Checking if apigateway_scraper is installed...")
-    scraper_check = c.run(
-        f"bash -c 'source {venv_dir}/bin/activate && "
-        f"cd {deploy_path} && "
-        f"python -c \"import apigateway_scraper; "
-        f"print(\\\"apigateway_scraper installed\\\")\"'",
-        pty=True,
-        warn=True,
-        hide=True
-    )
-
-    if scraper_check and scraper_check.ok:
+    if SCRAPER_FOUND in output:
         logger.info("Installing Playwright browsers...")
         c.run(
             f"bash -c 'source {venv_dir}/bin/activate && "
@@ -275,6 +490,27 @@ def install_deps(c: Connection | DockerRunner | Context, config: dict) -> None:
             "skipping Playwright browser installation."
         )
 
+def manage_command(config: dict, args: str) -> str:
+    """
+    Build a command running ``manage.py`` with the virtualenv's Python.
+
+    Calling the interpreter of the virtualenv directly is equivalent to
+    activating it first, without starting a ``bash`` just to source the
+    activate script.
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :param args: Arguments for ``manage.py`` (e.g. ``migrate --plan``).
+    :type args: str
+
+    :return: Shell command running the management command.
+    :rtype: str
+    """
+    deploy_path = config["deploy_path"]
+    python = f"{deploy_path}/{config.get('venv', 'venv')}/bin/python"
+    return f"cd {deploy_path} && {python} manage.py {args}"
+
 def migrate(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     Run Django migrations and optionally run `db_seed`.
@@ -292,27 +528,22 @@ def migrate(c: Connection | DockerRunner | Context, config: dict) -> None:
     """
     logger = get_logger(config['name'])
 
-    # Get virtualenv folder from config, defaulting to 'venv'
-    venv_path = config.get("venv", "venv")
-
-    # Get deployment path from config
-    deploy_path = config['deploy_path']
-
     # Log that the migration plan will be validated
     logger.info("Validating Django migration plan...")
 
     # Run migration plan check inside virtualenv
     plan_check = c.run(
-        f"bash -c 'source {deploy_path}/{venv_path}/bin/activate && "
-        f"cd {deploy_path} && python manage.py migrate --plan'",
-        pty=True,
+        manage_command(config, "migrate --plan"),
         warn=True,
         hide=True
     )
     # Abort if validation fails or if plan_check is None
     if not plan_check or plan_check.failed:
         logger.error("Migration plan check failed. Aborting deploy.")
-        output = getattr(plan_check, "stdout", "").strip()
+        output = (
+            getattr(plan_check, "stdout", "")
+            + getattr(plan_check, "stderr", "")
+        ).strip()
         if output:
             logger.error(f"Error output:\n{output}")
         msg_raise = "Migration validation failed."
@@ -324,11 +555,7 @@ def migrate(c: Connection | DockerRunner | Context, config: dict) -> None:
 
     try:
         # Execute real migration command
-        c.run(
-            f"bash -c 'source {deploy_path}/{venv_path}/bin/activate && "
-            f"cd {deploy_path} && python manage.py migrate'",
-            pty=True
-        )
+        c.run(manage_command(config, "migrate"))
 
     except DeployerException as e:
         # Handle any exception during migration
@@ -339,21 +566,173 @@ def migrate(c: Connection | DockerRunner | Context, config: dict) -> None:
     logger.info("Running Django db_seed...")
     # Execute db_seed command with visible output for debugging
     result = c.run(
-        f"bash -c 'source {deploy_path}/{venv_path}/bin/activate && "
-        f"cd {deploy_path} && python manage.py db_seed'",
-        pty=True,
+        manage_command(config, "db_seed"),
         warn=True
     )
 
     # Check if db_seed failed
     if result and result.failed:
         logger.error("db_seed command failed.")
-        output = getattr(result, "stdout", "").strip()
+        output = (
+            getattr(result, "stdout", "") + getattr(result, "stderr", "")
+        ).strip()
         if output:
             logger.error(f"Error output:\n{output}")
         msg_raise = "db_seed execution failed."
         raise DeployerException(msg_raise)
 
+def reuse_from_previous_release(
+        c: Connection | DockerRunner | Context,
+        config: dict,
+        hash_command: str,
+        target: str,
+        fixup: str = ""
+    ) -> tuple[str, bool]:
+    """
+    Copy a generated directory from the previous release if unchanged.
+
+    Runs ``hash_command`` in the release to fingerprint the inputs of
+    ``target`` and compares it with the `hash_marker` file stored in
+    the previous release. On a match, the previous ``target`` is copied
+    as hard links and ``fixup`` (if any) runs on the copy. Everything
+    runs in a single remote command.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :param hash_command: Command printing a hash of the inputs.
+    :type hash_command: str
+
+    :param target: Directory to reuse, relative to the release.
+    :type target: str
+
+    :param fixup: Command run in the release after copying the target.
+    :type fixup: str
+
+    :return: Hash of the inputs (empty if it could not be computed) and
+            whether the previous directory was reused.
+    :rtype: tuple[str, bool]
+    """
+    deploy_path = config['deploy_path']
+    previous = config.get("previous_release") or "/nonexistent"
+    marker = hash_marker(target)
+    fixup = f"&& {{ {fixup}; }} " if fixup else ""
+
+    # The copy shares its files with the previous release: fixups must
+    # replace the files they edit instead of writing through the links
+    # (GNU `sed -i` does, by renaming a new file over the old one)
+    result = c.run(
+        f"cd {deploy_path} && hash=$({hash_command} | sha256sum "
+        f"| cut -d' ' -f1) && echo \"$hash\" && "
+        f"test \"$hash\" = \"$(cat {previous}/{marker} 2>/dev/null)\" "
+        f"&& test -d {previous}/{target} && test ! -e {target} "
+        f"&& cp -al {previous}/{target} {target} "
+        f"{fixup}"
+        f"&& echo \"$hash\" > {marker} && echo reused",
+        hide=True,
+        warn=True
+    )
+    # A failed comparison still prints the hash, so ignore the exit code
+    lines = result.stdout.split() if result is not None else []
+    inputs_hash = lines[0] if lines else ""
+    return inputs_hash, "reused" in lines
+
+# Files whose changes require running collectstatic again
+DEFAULT_STATIC_INPUTS = ("*/static/*", "*settings*.py")
+
+def reuse_static_files(
+        c: Connection | DockerRunner | Context,
+        config: dict
+    ) -> tuple[str, bool]:
+    """
+    Reuse the collected static files of the previous release if possible.
+
+    The inputs are the files matching the ``static_inputs`` patterns
+    (`find -path` globs, by default every file under a ``static``
+    directory and every settings module, which hold ``STATIC_URL``,
+    ``STATICFILES_DIRS`` and ``STORAGES``) plus the requirements files,
+    which pin the packages shipping their own assets. See
+    `reuse_from_previous_release`.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :return: Hash of the static sources and whether the previous
+            ``static_root`` was reused.
+    :rtype: tuple[str, bool]
+    """
+    venv_path = config.get("venv", "venv")
+    static_root = config.get("static_root", "staticfiles")
+    inputs = config.get("static_inputs", DEFAULT_STATIC_INPUTS)
+    patterns = "".join(f"-path {shlex.quote(p)} -o " for p in inputs)
+
+    return reuse_from_previous_release(
+        c,
+        config,
+        f"find . -path ./{venv_path} -prune -o -type f \\( "
+        f"{patterns}-name 'requirements*.txt' \\) -print0 "
+        f"| sort -z | xargs -0 -r sha256sum",
+        static_root
+    )
+
+# Requirement lines installing from the release itself: editable installs,
+# local paths and file: URLs
+LOCAL_REQUIREMENT_PATTERN = r"^[[:space:]]*(-e|--editable|\.{0,2}/)|file:"
+
+def reuse_virtualenv(
+        c: Connection | DockerRunner | Context,
+        config: dict
+    ) -> tuple[str, bool]:
+    """
+    Reuse the virtualenv of the previous release if possible.
+
+    The inputs are the requirements and project files plus the version
+    and location of the remote ``python3``, so a virtualenv built for
+    an interpreter that has since been upgraded is never reused.
+    Virtualenvs embed their own path in scripts such as ``bin/activate``
+    and the console script shebangs, so those are rewritten in the copy.
+    This relies on GNU `sed -i`, which replaces the hard link with a new
+    file and leaves the previous release untouched. See
+    `reuse_from_previous_release`.
+
+    Editable installs and local paths in the requirements (``-e .``,
+    ``./libs/x``, ``file:`` URLs) tie the ``.pth`` and ``__editable__``
+    files of the virtualenv to the release they were installed from. The
+    release path is then hashed too, so such virtualenvs are never
+    reused.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+
+    :return: Hash of the requirements and whether the previous
+            virtualenv was reused.
+    :rtype: tuple[str, bool]
+    """
+    venv_path = config.get("venv", "venv")
+    old_venv = f"{config.get('previous_release')}/{venv_path}"
+    new_venv = f"{config['deploy_path']}/{venv_path}"
+    local_requirements = shlex.quote(LOCAL_REQUIREMENT_PATTERN)
+
+    return reuse_from_previous_release(
+        c,
+        config,
+        "{ sha256sum requirements*.txt pyproject.toml poetry.lock "
+        "2>/dev/null; python3 -VV; readlink -f \"$(command -v python3)\"; "
+        f"! grep -qsE {local_requirements} requirements*.txt || pwd; }}",
+        venv_path,
+        f"grep -rlI {old_venv} {venv_path}/bin "
+        f"| xargs -r sed -i \"s|{old_venv}|{new_venv}|g\""
+    )
+
 def collect_static(
         c: Connection | DockerRunner | Context,
         config: dict
@@ -361,7 +740,13 @@ def collect_static(
     """
     Run Django's `collectstatic` to gather static files.
 
-    Executes `manage.py collectstatic --noinput` inside the virtualenv.
+    Executes `manage.py collectstatic --noinput` inside the virtualenv,
+    unless `reuse_static_files` could take the files of the previous
+    release. Only files matching ``static_inputs`` are compared, so
+    assets found elsewhere (e.g. a ``STATICFILES_DIRS`` entry not named
+    ``static``, or settings outside a ``*settings*.py`` file) go
+    unnoticed unless listed there. Set ``force_collectstatic`` to always
+    run it.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -371,24 +756,74 @@ def collect_static(
     """
     logger = get_logger(config['name'])
 
-    # Get virtualenv path from config
-    venv_path = config.get("venv", "venv")
-
-    # Get deployment path
-    deploy_path = config['deploy_path']
+    # Skip the whole step when the static sources did not change
+    static_hash = ""
+    if not config.get("force_collectstatic", False):
+        static_hash, reused = reuse_static_files(c, config)
+        if reused:
+            logger.info("Static files unchanged, reusing previous release.")
+            return
 
     # Log that we're collecting static files
     logger.info("Collecting static files...")
 
+    # Remember the sources hash for the next deploy once it succeeded
+    static_root = config.get("static_root", "staticfiles")
+    save_hash = (
+        f" && echo {static_hash} > {hash_marker(static_root)}"
+        if static_hash else ""
+    )
+
     # Run collectstatic inside virtualenv, silencing output
     c.run(
-        f"bash -c 'source {deploy_path}/{venv_path}/bin/activate && "
-        f"cd {deploy_path} && python manage.py collectstatic "
-        f"--noinput > /dev/null 2>&1'",
-        pty=True
+        manage_command(config, "collectstatic --noinput > /dev/null 2>&1")
+        + save_hash
     )
 
-# ruff: noqa: PLR0912
+def restart_units(
+        c: Connection | DockerRunner | Context,
+        config: dict
+    ) -> None:
+    """
+    Restart the units listed in ``services`` with a single command.
+
+    Uses one ``systemctl try-restart`` for all units, which leaves
+    stopped units alone. Docker containers usually lack systemd, so
+    there the units are restarted with ``service``, all at once in the
+    same shell.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
+    """
+    logger = get_logger(config['name'])
+    services = config["services"]
+
+    logger.info(f"Restarting units: {', '.join(services)}")
+    if isinstance(c, DockerRunner):
+        # Restart every unit in the background, then fail if any did
+        script = "\n".join([
+            *(f"service {shlex.quote(svc)} restart & pids=\"$pids $!\""
+              for svc in services),
+            "status=0",
+            "for pid in $pids; do wait $pid || status=1; done",
+            "exit $status"
+        ])
+        result = run_script(c, script, warn=True)
+    else:
+        result = c.sudo(
+            f"systemctl try-restart {shlex.join(services)}", warn=True
+        )
+
+    if result is None or result.failed:
+        logger.error(f"Failed to restart units: {', '.join(services)}")
+
+# Exit status reported instead of running a restart script that does
+# not exist, chosen outside the range of common script failures
+SCRIPT_MISSING_STATUS = 213
+
 def restart_services(
         c: Connection | DockerRunner | Context,
         config: dict
@@ -398,7 +833,8 @@ def restart_services(
 
     Uses the bash script 'start_procfile_supervisord.sh' to handle the
     restart process.
-    If the script doesn't exist, logs a warning and continues.
+    If the script doesn't exist, logs a warning and continues. When
+    ``services`` is configured, those units are restarted instead.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -408,56 +844,45 @@ def restart_services(
     """
     logger = get_logger(config['name'])
 
+    # Configured units replace the Procfile script
+    if config.get("services"):
+        restart_units(c, config)
+        return
+
     # Get site name from config
     site = config['name']
 
     # Define script path
     procfile_script_path = "/scripts/start_procfile_supervisord.sh"
 
-    # Check if the Procfile script exists
-    check_script = c.run(
-        f"test -f {procfile_script_path} && echo 'exists' || echo 'not_found'",
-        hide=True,
+    # Restart a specific site, or all sites
+    target = site if site and site != "all" else ""
+
+    # Run the script only if it exists, in the same command as the check
+    logger.info(f"Restarting services for {site}...")
+    result = c.run(
+        f"if [ -f {procfile_script_path} ]; then "
+        f"{procfile_script_path} {target}; "
+        f"else exit {SCRIPT_MISSING_STATUS}; fi",
         warn=True
     )
-    if check_script is None:
+
+    if result is not None and result.exited == SCRIPT_MISSING_STATUS:
         logger.warning(
             f"Script {procfile_script_path} not found. "
             f"Skipping services restart."
         )
+    elif result and not result.failed:
+        logger.info(
+            f"Services for {site} restarted successfully"
+        )
     else:
-        script_exists = (
-            check_script.stdout.strip() == "exists"
+        logger.error(f"Failed to restart services for {site}")
+        error_details = (
+            result.stderr if result and hasattr(result, 'stderr')
+            else 'Unknown error'
         )
-
-        if not script_exists:
-            logger.warning(
-                f"Script {procfile_script_path} not found. "
-                f"Skipping services restart."
-            )
-        else:
-            logger.info(f"Restarting services for {site}...")
-
-            # Determine if we should restart a specific site or all sites
-            if site and site != "all":
-                # Restart specific site
-                result = c.run(f"{procfile_script_path} {site}", warn=True)
-            else:
-                # Restart all sites
-                result = c.run(f"{procfile_script_path}", warn=True)
-
-            # Check if the command executed successfully
-            if result and not result.failed:
-                logger.info(
-                    f"Services for {site} restarted successfully"
-                )
-            else:
-                logger.error(f"Failed to restart services for {site}")
-                error_details = (
-                    result.stderr if result and hasattr(result, 'stderr')
-                    else 'Unknown error'
-                )
-                logger.error(f"Error details: {error_details}")
+        logger.error(f"Error details: {error_details}")
 
 def set_writable_dirs(
         c: Connection | DockerRunner | Context,
@@ -487,29 +912,109 @@ def set_writable_dirs(
     chmod_mode = config.get("writable_chmod_mode", "775")
     deploy_path = config["deploy_path"]
 
-    # Loop through each defined directory
-    for directory in writable_dirs:
-        # Compose full path and chmod command
-        full_path = os.path.join(deploy_path, directory)
-        recursive_flag = "-R " if recursive else ""
-        chmod_cmd = f"chmod {recursive_flag}{chmod_mode} {full_path}"
+    # chmod takes every directory at once and keeps going past failures
+    release_prefix = f"{deploy_path}/"
+    paths = " ".join(
+        shlex.quote(release_prefix + directory) for directory in writable_dirs
+    )
+    recursive_flag = "-R " if recursive else ""
+    chmod_cmd = f"chmod {recursive_flag}{shlex.quote(chmod_mode)} {paths}"
 
+    for directory in writable_dirs:
         logger.info(f"Setting writable permissions on: {directory}")
 
-        # Use sudo or regular run based on config
-        if use_sudo:
-            c.sudo(chmod_cmd, warn=True)
-        else:
-            c.run(chmod_cmd, warn=True)
+    # Use sudo or regular run based on config
+    if use_sudo:
+        c.sudo(chmod_cmd, warn=True)
+    else:
+        c.run(chmod_cmd, warn=True)
+
+def backup_command(
+        releases_path: str,
+        release_name: str,
+        backup_file: str,
+        backup_format: str,
+        marker: str
+    ) -> str:
+    """
+    Build the command writing the backup of a release.
+
+    Archives are streamed straight into ``backup_file``. ``tar.zst``
+    compresses with `zstd` on every core, falling back to a ``.tar.gz``
+    next to it when `zstd` is not installed; any other format is gzip,
+    compressed with `pigz` on every core when it is installed. Once the
+    backup is written, the release name and the file actually written
+    are recorded in ``marker``.
+
+    :param releases_path: Directory holding the releases.
+    :type releases_path: str
+
+    :param release_name: Name of the release to back up.
+    :type release_name: str
+
+    :param backup_file: Destination of the backup.
+    :type backup_file: str
+
+    :param backup_format: ``snapshot``, ``tar.zst`` or ``tar.gz``.
+    :type backup_format: str
+
+    :param marker: File recording the last backup taken.
+    :type marker: str
+
+    :return: Shell command creating the backup.
+    :rtype: str
+    """
+    # Every path is quoted, as the script is itself quoted into bash -c
+    q_name = shlex.quote(release_name)
+    q_marker = shlex.quote(marker)
+    if backup_format == "snapshot":
+        release = shlex.quote(os.path.join(releases_path, release_name))
+        q_file = shlex.quote(backup_file)
+        return (
+            f"cp -al {release} {q_file} && "
+            f"echo {q_name} {q_file} > {q_marker}"
+        )
+
+    # Arguments selecting the release inside the archive
+    members = f"-C {shlex.quote(releases_path)} {q_name}"
+
+    # gzip archive, compressed on every core when pigz is installed
+    gzip = (
+        "if command -v pigz > /dev/null; then "
+        f"tar -cf - {members} | pigz > \"$out\"; "
+        f"else tar -czf \"$out\" {members}; fi"
+    )
+
+    # $out holds the file actually written, recorded in the marker
+    if backup_format == "tar.zst":
+        gzip_file = backup_file.removesuffix(".tar.zst") + ".tar.gz"
+        script = (
+            f"if command -v zstd > /dev/null; then "
+            f"out={shlex.quote(backup_file)}; "
+            f"tar -cf - {members} | zstd -T0 -3 -q -o \"$out\"; "
+            f"else out={shlex.quote(gzip_file)}; {gzip}; fi"
+        )
+    else:
+        script = f"out={shlex.quote(backup_file)}; {gzip}"
+    script += f" && echo {q_name} \"$out\" > {q_marker}"
+
+    return f"bash -o pipefail -c {shlex.quote(script)}"
 
 def create_backup(
         c: Connection | DockerRunner | Context,
         config: dict
     ) -> None:
     """
-    Create a compressed `.tar.gz` backup before deployment.
+    Create a backup of the current release before deployment.
 
-    Also removes older backups if the number exceeds `max_backups`.
+    By default the backup is a compressed `.tar.gz` archive, or a
+    `.tar.zst` one with ``backup_format: tar.zst``. With
+    ``backup_format: snapshot`` it is a hardlink copy of the release
+    (`cp -al`), which takes no time or space for unchanged files but
+    requires `backup_path` on the same filesystem and shares file
+    contents with the release. Also removes older backups if the number
+    exceeds `max_backups`. The live release is not backed up again if
+    the backup taken from it last time still exists.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -521,7 +1026,6 @@ def create_backup(
 
     # Load backup configuration from site config
     backup_path = config.get("backup_path")
-    max_backups = config.get("max_backups", 5)
 
     # If backup path is not defined, skip this step
     if not backup_path:
@@ -532,18 +1036,22 @@ def create_backup(
     # Build backup filename and path
     deploy_path = config["deploy_path"]
     site_name = config["name"]
-    timestamp = datetime.now(UTC).strftime("%Y%m%d%H%M%S")
+    timestamp = started_at(config).strftime("%Y%m%d%H%M%S")
+    backup_format = config.get("backup_format", "tar.gz")
+    marker = os.path.join(backup_path, f".{site_name}_last_backup")
+    snapshot = backup_format == "snapshot"
     backup_file = os.path.join(
-        backup_path, f"{site_name}_{timestamp}.tar.gz"
+        backup_path,
+        f"{site_name}_{timestamp}" if snapshot else
+        f"{site_name}_{timestamp}.{backup_format}"
     )
 
-    # Check if current symlink exists (active deployment)
-    result = c.run(
-        f"test -L {deploy_path}/current && echo 'exists'",
-        hide=True, warn=True
-    )
+    # Check the current symlink and its target at once
+    current = f"{deploy_path}/current"
+    kinds = probe_paths(c, current, f"{current}/")
 
-    if not result or not result.ok or result.stdout.strip() != 'exists':
+    # Check if current symlink exists (active deployment)
+    if kinds[current] != "symbolic link":
         msg = (
             "Skipping backup: No active deployment found "
             "(current symlink doesn't exist)."
@@ -552,39 +1060,30 @@ def create_backup(
         return
 
     # Verify that the symlink points to a valid directory
-    target_check = c.run(
-        f"test -d {deploy_path}/current && echo 'valid'",
-        hide=True, warn=True
-    )
-
-    if (not target_check or not target_check.ok or
-            target_check.stdout.strip() != 'valid'):
+    if kinds[f"{current}/"] != "directory":
         msg = (
             "Skipping backup: Current symlink points to invalid directory."
         )
         logger.warning(msg)
         return
 
-    logger.info(
-        f"Creating backup for site '{site_name}' at {backup_file}"
-    )
-
     # Ensure backup directory exists
-    remote_user = c.run("whoami", hide=True)
-    if remote_user:
-        remote_user = remote_user.stdout.strip()
-        c.sudo(f"mkdir -p {backup_path}")
-        c.sudo(f"chown {remote_user}:{remote_user} {backup_path}")
+    run_script(c, ensure_dir_command(backup_path))
 
-    # Create compressed backup using tar
+    # Create the snapshot or the compressed archive
     try:
-        # Get the current release name
+        # Get the current release name, and whether the last backup
+        # (still present) was already taken from it
         result = c.run(
-            f"readlink {deploy_path}/current | xargs basename",
+            f"release=$(readlink {deploy_path}/current | xargs basename) "
+            f"&& echo \"$release\" && read -r last file < {marker} "
+            f"&& [ \"$last\" = \"$release\" ] && test -e \"$file\" "
+            f"&& echo backed_up",
             hide=True,
             warn=True
         )
-        release_name = result.stdout.strip() if result and result.ok else ""
+        lines = result.stdout.split() if result is not None else []
+        release_name = lines[0] if lines else ""
 
         if not release_name:
             logger.warning(
@@ -593,10 +1092,23 @@ def create_backup(
             )
             return
 
-        # Backup only the current release
+        if "backed_up" in lines:
+            logger.info(
+                f"Release {release_name} is already backed up. "
+                f"Skipping backup."
+            )
+            return
+
+        logger.info(
+            f"Creating backup for site '{site_name}' at {backup_file}"
+        )
+
+        # Backup only the current release, then remember it
         c.run(
-            f"tar -czf {backup_file} -C {deploy_path}/releases "
-            f"{release_name}"
+            backup_command(
+                f"{deploy_path}/releases", release_name, backup_file,
+                backup_format, marker
+            )
         )
         logger.info(f"Backup created for release: {release_name}")
     except DeployerException as e:
@@ -604,27 +1116,45 @@ def create_backup(
         return
 
     # Delete older backups if exceeding max_backups
-    try:
-        result = c.run(
-            f"ls -1t {backup_path}/{site_name}_*.tar.gz",
-            hide=True, warn=True
-        )
+    cleanup_old_backups(c, config)
 
-        # Initialize files as an empty list by default
-        files = []
+def cleanup_old_backups(
+        c: Connection | DockerRunner | Context,
+        config: dict
+    ) -> None:
+    """
+    Remove the oldest backups of the site beyond `max_backups`.
 
-        # Only assign to files if there are results
-        if result and result.stdout:
-            files = result.stdout.strip().splitlines()
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
 
-        # Now we can safely verify len(files)
-        if len(files) > max_backups:
-            old_files = files[max_backups:]
-            for file in old_files:
-                c.run(f"rm -f {os.path.join(backup_path, file)}")
-                logger.info(f"Removed old backup: {file}")
-    except DeployerException as e:
-        logger.warning(f"Could not cleanup old backups: {e}")
+    :param config: Site configuration dictionary.
+    :type config: dict
+    """
+    logger = get_logger(config["name"])
+
+    backup_path = config["backup_path"]
+    max_backups = config.get("max_backups", 5)
+    site_name = config["name"]
+    snapshot = config.get("backup_format") == "snapshot"
+
+    # List backups newest first and delete all but the most recent ones
+    # in a single invocation, printing each removed path
+    pattern = f"{site_name}_*/" if snapshot else f"{site_name}_*.tar.*"
+    result = c.run(
+        f"ls -1dt {backup_path}/{pattern} | tail -n +{max_backups + 1} | "
+        f"while read -r backup; do "
+        f"rm -rf -- \"$backup\" && echo \"$backup\"; done",
+        hide=True,
+        warn=True
+    )
+
+    if not result or result.failed:
+        logger.warning("Could not cleanup old backups.")
+        return
+
+    for backup in result.stdout.strip().splitlines():
+        logger.info(f"Removed old backup: {backup}")
 
 def deploy_to_release_folder(
         c: Connection | DockerRunner | Context,
@@ -643,6 +1173,8 @@ def deploy_to_release_folder(
 
     :return: Absolute path to the new release directory.
     :rtype: str
+
+    :raises DeployerException: If the release folder already exists.
     """
     logger = get_logger(config["name"])
 
@@ -650,32 +1182,31 @@ def deploy_to_release_folder(
     releases_path = os.path.join(deploy_path, "releases")
 
     # Generate release folder name with timestamp (ms precision)
-    timestamp = datetime.now(UTC).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    timestamp = started_at(config).strftime("%Y%m%d_%H%M%S_%f")[:-3]
     release_path = os.path.join(releases_path, timestamp)
 
     # Temporary folder containing newly cloned code
     tmp_path = os.path.join(deploy_path, "__clone_tmp__")
 
-    # Ensure releases folder exists
-    remote_user = c.run("whoami", hide=True)
-    if remote_user:
-        remote_user = remote_user.stdout.strip()
-        c.sudo(f"mkdir -p {releases_path}", warn=True)
-        c.sudo(f"chown {remote_user}:{remote_user} {releases_path}")
+    # Ensure releases folder exists, and check the release folder in the
+    # same command
+    with BatchingRunner(c).batch() as b:
+        b.run(ensure_dir_command(releases_path), hide=True)
+        b.run(f"test -e {release_path} && echo exists", hide=True, warn=True)
+        result = b.flush()
 
     # Abort if the release folder already exists
-    result = c.run(f"test -e {release_path}", warn=True, hide=True)
-    if result and result.ok:
-        logger.error(f"Release path already exists: {release_path}")
-        return ""
-
-    # Move __clone_tmp__ into the final release folder
-    c.sudo(f"mv {tmp_path} {release_path}", warn=True)
+    if result and "exists" in result.stdout.split():
+        msg_raise = f"Release path already exists: {release_path}"
+        raise DeployerException(msg_raise)
 
-    # Link the env file (used for secrets) into the new release
+    # Move __clone_tmp__ into the final release folder and link the env
+    # file (used for secrets) into it, in a single invocation
     env_source = os.path.join(deploy_path, "env")
     env_target = os.path.join(release_path, "env")
-    c.sudo(f"ln -sf {env_source} {env_target}", warn=True)
+    with BatchingRunner(c).batch() as b:
+        b.sudo(f"mv {tmp_path} {release_path}", warn=True)
+        b.sudo(f"ln -sf {env_source} {env_target}", warn=True)
     logger.info(f"env linked: {env_target} -> {env_source}")
 
     # Log release creation details
@@ -704,7 +1235,7 @@ def symlink_release_to_current(
     current_symlink = os.path.join(original_path, "current")
 
     # Point the current symlink to this new release
-    c.run(f"ln -sfn {deploy_path} {current_symlink}", warn=True)
+    c.run(swap_symlink_command(deploy_path, current_symlink), warn=True)
 
     # Log release creation details
     logger.info(f"Symlink updated: {current_symlink} -> {deploy_path}")
@@ -733,20 +1264,51 @@ def cleanup_old_releases(
     project_root = os.path.dirname(current_release_path)
     releases_path = project_root
 
-    # List all releases sorted by most recent
-    result = c.run(f"ls -1dt {releases_path}/*", hide=True, warn=True)
+    # Never prune relative to the remote working directory (or from /)
+    if not os.path.isabs(releases_path) or releases_path == "/":
+        logger.error(
+            f"Refusing to clean up releases in '{releases_path}': "
+            f"not an absolute releases directory."
+        )
+        return
+
+    # List releases newest first and delete all but the most recent ones
+    # in a single invocation, printing each removed path
+    result = c.run(
+        f"{newest_first_command(releases_path)} | tail -n +{keep + 1} | "
+        f"while read -r release; do "
+        f"rm -rf -- \"$release\" && echo \"$release\"; done",
+        hide=True,
+        warn=True
+    )
 
-    if not result or not result.stdout:
+    if not result or result.failed:
         logger.warning("No releases found. Skipping cleanup.")
         return
 
-    all_releases = result.stdout.strip().splitlines()
+    for release in result.stdout.strip().splitlines():
+        logger.info(f"Removed old release: {release}")
+
+def get_current_release(
+    c: Connection | DockerRunner | Context,
+    config: dict
+) -> str:
+    """
+    Resolve the release the `current` symlink points to.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Connection, DockerRunner, Context]
+
+    :param config: Site configuration dictionary.
+    :type config: dict
 
-    if len(all_releases) > keep:
-        to_delete = all_releases[keep:]
-        for release in to_delete:
-            logger.info(f"Removing old release: {release}")
-            c.run(f"rm -rf {release}", warn=True)
+    :return: Absolute path of the live release, or an empty string if
+            there is none (or it no longer exists).
+    :rtype: str
+    """
+    current_symlink = os.path.join(config["deploy_path"], "current")
+    result = c.run(f"readlink -e {current_symlink}", hide=True, warn=True)
+    return result.stdout.strip() if result and result.ok else ""
 
 def rollback_to_previous_release(
     c: Connection | DockerRunner | Context,
@@ -756,7 +1318,9 @@ def rollback_to_previous_release(
     Revert the `current` symlink to the previous release.
 
     Deletes the failed release folder and restores the last known
-    working version.
+    working version. During a deploy, the release recorded by
+    `get_current_release` is restored directly with a single command;
+    otherwise the most recent releases are listed to find it.
 
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
@@ -779,8 +1343,24 @@ def rollback_to_previous_release(
     # Path to current symlink
     current_symlink = os.path.join(base_path, "current")
 
+    # Fast path: swap back to the release that was live before deploying
+    previous_release = config.get("previous_release")
+    if previous_release and deploy_path.startswith(f"{releases_path}/"):
+        logger.warning(f"Rolling back to previous release: {previous_release}")
+        result = c.run(
+            f"test -d {previous_release} && "
+            f"{swap_symlink_command(previous_release, current_symlink)} && "
+            f"rm -rf {deploy_path}",
+            warn=True,
+            hide=True
+        )
+        if result and result.ok:
+            logger.info(f"Removed failed release: {deploy_path}")
+            return
+        logger.warning("Previous release is gone, searching releases...")
+
     # List all available releases
-    result = c.run(f"ls -1dt {releases_path}/*", warn=True, hide=True)
+    result = c.run(newest_first_command(releases_path), warn=True, hide=True)
 
     if not result or result.failed or not result.stdout.strip():
         logger.error("No releases found.")
@@ -798,11 +1378,20 @@ def rollback_to_previous_release(
     failed_release = all_releases[0]
     previous_release = all_releases[1]
 
-    logger.warning(f"Rolling back to previous release: {previous_release}")
-    c.run(f"ln -sfn {previous_release} {current_symlink}", warn=True)
+    with BatchingRunner(c).batch() as b:
+        logger.warning(
+            f"Rolling back to previous release: {previous_release}"
+        )
+        b.run(
+            swap_symlink_command(previous_release, current_symlink),
+            warn=True
+        )
+
+        logger.info(f"Removing failed release: {failed_release}")
+        b.run(f"rm -rf {failed_release}", warn=True)
 
-    logger.info(f"Removing failed release: {failed_release}")
-    c.run(f"rm -rf {failed_release}", warn=True)
+# Exit status of the lock script when `sudo` would ask for a password
+SUDO_PASSWORD_STATUS = 214
 
 def acquire_lock(
         c: Connection | DockerRunner | Context,
@@ -813,13 +1402,19 @@ def acquire_lock(
 
     Writes session metadata into the lock file. Aborts if already locked.
 
+    The privileged steps of a deploy run plain `sudo` inside batched
+    scripts, which Fabric cannot answer a password prompt for, so
+    passwordless sudo is checked here first and the deploy fails before
+    changing anything if it is not available.
+
     :param c: Fabric runner or connection object.
     :type c: Union[Connection, DockerRunner, Context]
 
     :param config: Site configuration dictionary.
     :type config: dict
 
-    :raises DeployerException: If a lock is already present.
+    :raises DeployerException: If a lock is already present or sudo
+            needs a password.
     :return: Unique session lock ID.
     :rtype: str
     """
@@ -828,53 +1423,54 @@ def acquire_lock(
     # Path where the lock file will be created
     deploy_path = config['deploy_path']
 
-    # Check if the deploy directory exists, if not, create it
-    logger.info("Ensured deployment path exists.")
-    result = c.run(f"test -d {deploy_path}", warn=True, hide=True)
-    if not result or not result.ok:
-        # Create the temporary directory with sudo and assign permissions
-        logger.info(f"Creating deploy directory: {deploy_path}")
-        remote_user = c.run("whoami", hide=True)
-        if remote_user:
-            remote_user = remote_user.stdout.strip()
-            c.sudo(f"mkdir -p {deploy_path}")
-            c.sudo(f"chmod 775 {deploy_path}")
-            c.sudo(f"chown {remote_user}:{remote_user} {deploy_path}")
-
     # Path to the lock file
     lock_file = os.path.join(deploy_path, ".deploy.lock")
 
     # Generate a unique ID using timestamp and UUID
-    lock_id = f"{datetime.now(UTC)
-                 .strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex}"
-
-    # Detect system user (who initiated the deployment)
-    user = getpass.getuser()
-
-    # If lock already exists, abort
-    result = c.run(f"test -f {lock_file}", warn=True, hide=True)
-    if result and result.ok:
-        msg = "Deployment is already locked. Another deploy in progress."
-        logger.error(msg)
-        msg = "Deploy locked. Use `fab2 unlock --site=...`"
-        msg += "to force unlock if needed."
-        raise DeployerException(msg)
+    locked_at = started_at(config)
+    lock_id = f"{locked_at.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex}"
 
     # Compose informative lock file content
     content = (
-        f"Locked at: {datetime.now(UTC).isoformat()}\n"
+        f"Locked at: {locked_at.isoformat()}\n"
         f"Host: {getattr(c, 'host', 'local')}\n"
-        f"User: {user}\n"
+        f"User: {LOCAL_USER}\n"
         f"Lock ID: {lock_id}\n"
     )
 
-    # Create the lock file explicitly and then write to it
-    c.sudo(f"touch {lock_file}")
-    # Set appropriate permissions 664 allows group read/write
-    c.sudo(f"chmod 664 {lock_file}")
+    # Create the deploy directory if needed, then the lock file
+    # atomically (noclobber opens it with O_EXCL) and already as 664,
+    # with a single sudo reading the content from a heredoc. Print the
+    # current lock instead if it already exists.
+    script = (
+        f"sudo -n true 2>/dev/null || exit {SUDO_PASSWORD_STATUS}\n"
+        f"{ensure_dir_command(deploy_path, '775')} || exit 1\n"
+        f"if ! sudo bash -c 'umask 002; set -C; cat > {lock_file}' "
+        f"2>/dev/null <<'LOCK'\n{content}LOCK\n"
+        f"then cat {lock_file} 2>/dev/null; exit 1; fi"
+    )
+    result = run_script(c, script, warn=True, hide=True)
+    if result is not None and result.exited == SUDO_PASSWORD_STATUS:
+        msg = (
+            "Passwordless sudo is required on the target "
+            "(sudo.password and --prompt-for-sudo-password are not used)."
+        )
+        logger.error(msg)
+        raise DeployerException(msg)
+    if not result or not result.ok:
+        owner = result.stdout.strip() if result is not None else ""
+        if not owner:
+            msg = f"Could not create the lock file {lock_file}."
+            logger.error(msg)
+            raise DeployerException(msg)
+        msg = "Deployment is already locked. Another deploy in progress."
+        logger.error(msg)
+        logger.error(f"Current lock:\n{owner}")
+        msg = "Deploy locked. Use `fab2 unlock --site=...`"
+        msg += "to force unlock if needed."
+        raise DeployerException(msg)
 
-    # Write lock file to remote system
-    c.run(f"sudo bash -c \"echo '{content}' > {lock_file}\"")
+    logger.info("Ensured deployment path exists.")
     logger.info("Deployment lock acquired.")
 
     return lock_id
@@ -911,14 +1507,13 @@ def release_lock(
         logger.info("Deployment lock forcibly released.")
         return
 
-    result = c.run(f"grep '^Lock ID:' {lock_file}", warn=True, hide=True)
+    # Remove the lock only if this session still owns it
+    result = c.run(
+        f"grep -qx 'Lock ID: {lock_id}' {lock_file} && rm -f {lock_file}",
+        warn=True,
+        hide=True
+    )
     if result and result.ok:
-        current_id = result.stdout.strip().split(":", 1)[-1].strip()
-    else:
-        current_id = ""
-
-    if current_id == lock_id:
-        c.run(f"rm -f {lock_file}", warn=True)
         logger.info("Deployment lock released.")
     else:
         logger.warning("Lock file not owned by this session. Skipping unlock.")
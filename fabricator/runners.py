@@ -7,12 +7,19 @@ local, SSH, and Docker runners.
 
 """
 
+import shlex
+from collections.abc import Iterator
+from contextlib import contextmanager
 from typing import Protocol
 
 from fabric2 import Connection
 from invoke.context import Context
 from invoke.runners import Result
 
+# Interval of SSH keepalive packets, so long idle steps (e.g. pip
+# install) do not let firewalls drop the shared transport
+SSH_KEEPALIVE_SECONDS = 30
+
 
 class Runner(Protocol):
 
@@ -76,6 +83,8 @@ class DockerRunner:
     :ivar user: User to run commands as inside the container.
     """
 
+    __slots__ = ("_prefix", "container_name", "inner_runner", "user")
+
     def __init__(
             self,
             container_name: str,
@@ -106,12 +115,19 @@ class DockerRunner:
         # Default user is root unless otherwise specified
         self.user = user
 
+        # Quoted docker exec prefix shared by every command
+        self._prefix = (
+            f"docker exec -u {shlex.quote(user)} "
+            f"{shlex.quote(container_name)} sh -c "
+        )
+
     def run(self, command: str, **kwargs) -> Result | None:
         """
         Execute a command inside the Docker container.
 
         Wraps the given command with ``docker exec`` and delegates execution
-        to the inner Fabric runner.
+        to the inner Fabric runner. The command is run by ``sh -c``, so
+        pipes and ``&&`` chains stay inside the container.
 
         :param command: Shell command to run inside the container.
         :type command: str
@@ -124,11 +140,7 @@ class DockerRunner:
         :rtype: Result or None
         """
         # Format docker exec command
-        full_cmd = (
-            f"docker exec -u {self.user} "
-            f"{self.container_name} "
-            f"{command}"
-        )
+        full_cmd = self._prefix + shlex.quote(command)
 
         # Run the command via inner runner and return its result directly
         return self.inner_runner.run(full_cmd, **kwargs)
@@ -164,3 +176,175 @@ class DockerRunner:
         :rtype: ContextManager
         """
         return self.inner_runner.cd(path)
+
+class BatchingRunner:
+
+    """
+    Wraps a runner to send several commands in a single invocation.
+
+    Outside of a `batch` block every call goes straight to the wrapped
+    runner. Inside it, commands are queued and executed together as one
+    ``bash`` script when the block exits, saving a round trip (and a
+    shell spawn) per command.
+
+    Queued calls return ``None``, so only commands whose result is not
+    inspected should be issued inside a batch. The script runs with
+    ``set -e``: a failing command aborts the batch, except for commands
+    queued with ``warn=True``, whose failures are ignored as they would
+    have been when run on their own. Calls with other options (such as
+    ``pty``) flush the queue and run immediately.
+
+    :param inner_runner: The runner that executes the batched script.
+    :type inner_runner: Union[Context, Connection, DockerRunner]
+
+    :ivar inner_runner: Underlying runner used to execute commands.
+    """
+
+    def __init__(self, inner_runner: Context | Connection | DockerRunner):
+        """
+        Initialize a new BatchingRunner instance.
+
+        :param inner_runner: Base runner (Context, Connection or
+                        DockerRunner).
+        :type inner_runner: Union[Context, Connection, DockerRunner]
+        """
+        # Runner used to execute the actual commands
+        self.inner_runner = inner_runner
+
+        # Pending commands, or None when not inside a batch
+        self._queue: list[str] | None = None
+
+        # Whether every queued command asked for hidden output
+        self._hide = True
+
+    def __getattr__(self, name: str):
+        """
+        Expose attributes of the inner runner (e.g. ``host``).
+
+        :param name: Attribute name.
+        :type name: str
+
+        :return: The attribute of the inner runner.
+        """
+        return getattr(self.inner_runner, name)
+
+    @contextmanager
+    def batch(self) -> Iterator["BatchingRunner"]:
+        """
+        Queue the commands issued inside the block and run them at exit.
+
+        Nested blocks join the outermost batch. If the block raises, the
+        queued commands are discarded.
+
+        :return: This runner, for use in a ``with ... as`` clause.
+        :rtype: Iterator[BatchingRunner]
+        """
+        # Join the current batch if one is already open
+        if self._queue is not None:
+            yield self
+            return
+
+        self._queue = []
+        self._hide = True
+        try:
+            yield self
+            self.flush()
+        finally:
+            self._queue = None
+
+    def flush(self) -> Result | None:
+        """
+        Execute the queued commands as one script and empty the queue.
+
+        :return: Result of the batched script, or None if nothing was
+                queued.
+        :rtype: Result or None
+        """
+        if not self._queue:
+            return None
+
+        # Fail fast, like the individual calls would have
+        script = "\n".join(["set -e", *self._queue])
+        hide = self._hide
+        self._queue.clear()
+        self._hide = True
+        return self.inner_runner.run(
+            f"bash -c {shlex.quote(script)}", hide=hide
+        )
+
+    def run(self, command: str, **kwargs) -> Result | None:
+        """
+        Run a command, or queue it when inside a batch.
+
+        :param command: Shell command to execute.
+        :type command: str
+
+        :param kwargs: Extra arguments for the runner (e.g., hide, warn).
+        :type kwargs: dict
+
+        :return: Result of the command, or None if it was queued.
+        :rtype: Result or None
+        """
+        # Outside a batch, or with options a script cannot honour
+        if self._queue is None or set(kwargs) - {"hide", "warn"}:
+            self.flush()
+            return self.inner_runner.run(command, **kwargs)
+
+        # Ignore failures of commands that tolerate them
+        if kwargs.get("warn"):
+            command = f"{{ {command}; }} || true"
+        self._queue.append(command)
+        self._hide = self._hide and bool(kwargs.get("hide"))
+        return None
+
+    def sudo(self, command: str, **kwargs) -> Result | None:
+        """
+        Run a command with ``sudo``, or queue it when inside a batch.
+
+        Batched ``sudo`` calls are issued as plain ``sudo`` commands, so
+        they require passwordless sudo on the target.
+
+        :param command: Shell command to run with elevated privileges.
+        :type command: str
+
+        :param kwargs: Extra options passed to the runner.
+        :type kwargs: dict
+
+        :return: Result of the command, or None if it was queued.
+        :rtype: Result or None
+        """
+        if self._queue is None:
+            return self.inner_runner.sudo(command, **kwargs)
+        return self.run(f"sudo {command}", **kwargs)
+
+    def cd(self, path: str):
+        """
+        Change directory within the inner runner context.
+
+        :param path: Directory path to switch to.
+        :type path: str
+
+        :return: A context manager for changing directories.
+        :rtype: ContextManager
+        """
+        return self.inner_runner.cd(path)
+
+def open_transport(c: Context | Connection | DockerRunner) -> None:
+    """
+    Open the SSH transport behind a runner, if any, ahead of use.
+
+    Fabric keeps a ``Connection`` open once connected, so opening it up
+    front lets every later command reuse the same authenticated
+    transport. Keepalive packets are enabled on it. Local contexts are
+    left untouched.
+
+    :param c: Fabric runner or connection object.
+    :type c: Union[Context, Connection, DockerRunner]
+    """
+    # Wrapping runners execute through their inner runner
+    while isinstance(c, DockerRunner | BatchingRunner):
+        c = c.inner_runner
+
+    if isinstance(c, Connection) and not c.is_connected:
+        c.open()
+        c.transport.set_keepalive(SSH_KEEPALIVE_SECONDS)
@@ -4,48 +4,122 @@ Module for utility functions.
 This module provides utility functions for the fabricator project.
 
 """
+import os
+import shutil
+import tempfile
 from pathlib import Path
 
 import yaml
 
 from fabricator.logger import get_logger
 
+# Names exported by ``from fabricator.utils import *``
+__all__ = ("SITES_FILE", "load_sites", "print_site_list", "save_sites")
+
 # Create a logger for this module
 logger = get_logger("utils")
 
 # Path to the shared sites.yml configuration file
 SITES_FILE = Path(__file__).resolve().parent.parent / "sites.yml"
 
+# Prefer the libyaml-backed loader and dumper when PyYAML was built
+# with them
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Note the slow path once, when the C extension is unavailable
+if not getattr(yaml, "__with_libyaml__", False):
+    logger.debug(
+        "PyYAML was built without libyaml; sites.yml is parsed with the "
+        "pure-Python loader. Reinstall PyYAML with libyaml support for "
+        "faster startup."
+    )
+
 def load_sites() -> dict:
     """
     Load the sites configuration from a YAML file.
 
     Parses the YAML configuration defined in the constant ``SITES_FILE``
-    and returns a dictionary with deployment data for each site.
+    and returns a dictionary with deployment data for each site. A
+    missing file is treated as an empty configuration.
 
     :return: Dictionary containing all configured sites.
     :rtype: dict
     """
-    # Open and parse the YAML file, returning a dictionary
-    with open(SITES_FILE) as f:
-        return yaml.safe_load(f)
+    # Read the whole file at once and parse it, returning a dictionary
+    try:
+        data = SITES_FILE.read_bytes()
+    except FileNotFoundError:
+        return {}
+    return yaml.load(data, Loader=YAML_LOADER) or {}
+
+def save_sites(sites: dict) -> None:
+    """
+    Save all site configurations to the YAML file.
+
+    Overwrites the existing file content with the provided dictionary.
+    Preserves key order and disables flow-style formatting for
+    readability. The file is replaced atomically, and left untouched
+    when the content did not change so cached parses stay valid.
+
+    :param sites: Dictionary containing all site configurations.
+    :type sites: dict
+    """
+    payload = yaml.dump(
+        sites,
+        Dumper=YAML_DUMPER,
+        default_flow_style=False,
+        sort_keys=False
+    ).encode()
+
+    # Skip the write, and the mtime bump, when nothing changed
+    try:
+        if SITES_FILE.read_bytes() == payload:
+            return
+    except FileNotFoundError:
+        pass
 
-def print_site_list() -> None:
+    # Write next to the file and rename, so readers never see it partial
+    tmp_file = tempfile.NamedTemporaryFile(
+        dir=SITES_FILE.parent, prefix=".sites.", suffix=".tmp", delete=False
+    )
+    try:
+        with tmp_file:
+            tmp_file.write(payload)
+        # Keep the mode of the current file (e.g. 0600 for credentials),
+        # or create it with the usual umask-based mode instead of the
+        # 0600 of temporary files
+        if SITES_FILE.exists():
+            shutil.copymode(SITES_FILE, tmp_file.name)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_file.name, 0o666 & ~umask)
+        os.replace(tmp_file.name, SITES_FILE)
+    except BaseException:
+        Path(tmp_file.name).unlink(missing_ok=True)
+        raise
+
+def print_site_list(sites: dict | None = None) -> None:
     """
     Print a list of configured sites and their repository URLs.
 
-    Loads the site configurations from the YAML file and logs each
-    site's name along with its associated Git repository URL.
+    Loads the site configurations from the YAML file, unless the caller
+    already has them, and logs each site's name along with its
+    associated Git repository URL.
+
+    :param sites: Already loaded site configurations, keyed by name.
+    :type sites: dict or None
 
     :return: This function returns nothing.
     :rtype: None
     """
-    # Load site configurations from the YAML file
-    sites = load_sites()
-
-    # Output a header line for context
-    logger.info("Available sites:")
+    # Load site configurations from the YAML file when not given
+    if sites is None:
+        sites = load_sites()
 
-    # Iterate over each site and log its repository URL
-    for site, cfg in sites.items():
-        logger.info(f" - {site}: {cfg['repository']}")
+    # Log the header and every site's repository URL as one record
+    lines = ["Available sites:"] + [
+        f" - {site}: {cfg['repository']}" for site, cfg in sites.items()
+    ]
+    logger.info("\n".join(lines))
@@ -6,50 +6,13 @@ This script allows you to add a new site to the sites configuration file.
 
 """
 import sys
-from pathlib import Path
 
-import yaml
+# Printed when the script is not called with a domain and a repository
+USAGE = (
+    './siteadd.py "app.example.com" '
+    '"git@github.com:example/www.example.com.git"'
+)
 
-# Define the path to the main sites configuration file
-SITES_FILE = Path(__file__).resolve().parent / "sites.yml"
-
-
-def load_sites():
-    """
-    Load all site configurations from the YAML file.
-
-    If the configuration file does not exist, an empty dictionary
-    is returned. Otherwise, parses and returns the YAML contents.
-
-    :return: Dictionary mapping site domains to their configurations.
-    :rtype: dict
-    """
-    # Return an empty dictionary if the file doesn't exist
-    if not SITES_FILE.exists():
-        return {}
-
-    # Open and load the YAML file
-    with open(SITES_FILE) as f:
-        return yaml.safe_load(f) or {}
-
-def save_sites(sites):
-    """
-    Save all site configurations to the YAML file.
-
-    Overwrites the existing file content with the provided dictionary.
-    Preserves key order and disables flow-style formatting for readability.
-
-    :param sites: Dictionary containing all site configurations.
-    :type sites: dict
-    """
-    # Open the YAML file in write mode and dump contents
-    with open(SITES_FILE, "w") as f:
-        yaml.dump(
-            sites,
-            f,
-            default_flow_style=False,
-            sort_keys=False
-        )
 
 def add_site(domain, repo_url):
     """
@@ -66,6 +29,9 @@ def add_site(domain, repo_url):
     :param repo_url: Git repository URL for the new site.
     :type repo_url: str
     """
+    # Imported here so a wrong invocation exits before loading PyYAML
+    from fabricator.utils import load_sites, save_sites
+
     # Load existing configurations
     sites = load_sites()
 
@@ -93,9 +59,8 @@ def add_site(domain, repo_url):
 if __name__ == "__main__":
     # Ensure exactly two arguments are passed (domain and repo)
     LIMIT_ARGS = 2
-    if len(sys.argv) != LIMIT_ARGS:
-        print("Usage: ./siteadd.py \"app.example.com\" "
-              "\"git@github.com:example/www.example.com.git\"")
+    if len(sys.argv) - 1 != LIMIT_ARGS:
+        print(f"Usage: {USAGE}")
         sys.exit(1)
 
     # Parse arguments
@@ -0,0 +1,130 @@
+"""
+Tests for the deployment recipes.
+
+These tests run the shell commands built by the recipes on the local
+machine, so they only need `bash`, `tar` and `gzip`.
+
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from invoke.context import Context
+
+from fabricator.recipes import backup_command, probe_paths
+
+
+class BackupCommandTest(unittest.TestCase):
+
+    """Check the files written and recorded by `backup_command`."""
+
+    def setUp(self):
+        """Create a release to back up and a PATH without zstd or pigz."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+        # A release with a single file
+        self.releases = self.root / "releases"
+        (self.releases / "20250101_000000_000").mkdir(parents=True)
+        (self.releases / "20250101_000000_000" / "app.py").write_text("x")
+
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+        self.marker = self.backups / ".site_last_backup"
+
+        # Only the tools the gzip fallback needs
+        self.bin = self.root / "bin"
+        self.bin.mkdir()
+        for tool in ("bash", "tar", "gzip"):
+            (self.bin / tool).symlink_to(shutil.which(tool))
+
+    def run_backup(self, backup_format: str, backup_file: Path) -> None:
+        """
+        Run the backup command with the restricted PATH.
+
+        :param backup_format: Value of the ``backup_format`` setting.
+        :type backup_format: str
+
+        :param backup_file: Requested destination of the backup.
+        :type backup_file: Path
+        """
+        command = backup_command(
+            str(self.releases), "20250101_000000_000", str(backup_file),
+            backup_format, str(self.marker)
+        )
+        env = {**os.environ, "PATH": str(self.bin)}
+        subprocess.run(
+            command, shell=True, check=True, env=env,
+            executable=str(self.bin / "bash")
+        )
+
+    def test_zst_falls_back_to_gzip_and_records_it(self):
+        """Without zstd the marker names the .tar.gz actually written."""
+        self.run_backup("tar.zst", self.backups / "site_1.tar.zst")
+
+        gzip_file = self.backups / "site_1.tar.gz"
+        self.assertTrue(gzip_file.is_file())
+        self.assertFalse((self.backups / "site_1.tar.zst").exists())
+        self.assertEqual(
+            self.marker.read_text().split(),
+            ["20250101_000000_000", str(gzip_file)]
+        )
+
+    def test_gzip_records_backup_file(self):
+        """A plain gzip backup is recorded under its requested name."""
+        backup_file = self.backups / "site_1.tar.gz"
+        self.run_backup("tar.gz", backup_file)
+
+        self.assertTrue(backup_file.is_file())
+        self.assertEqual(
+            self.marker.read_text().split(),
+            ["20250101_000000_000", str(backup_file)]
+        )
+
+    def test_quotes_in_paths(self):
+        """Spaces and quotes in the backup path are passed literally."""
+        backups = self.root / "it's backups"
+        backups.mkdir()
+        self.marker = backups / ".site_last_backup"
+        backup_file = backups / "site_1.tar.gz"
+        self.run_backup("tar.gz", backup_file)
+
+        self.assertTrue(backup_file.is_file())
+        self.assertEqual(
+            self.marker.read_text().strip(),
+            f"20250101_000000_000 {backup_file}"
+        )
+
+
+class ProbePathsTest(unittest.TestCase):
+
+    """Check the file types reported by `probe_paths`."""
+
+    def test_kinds(self):
+        """Links are reported as such unless the path ends with ``/``."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        (root / "release").mkdir()
+        (root / "current").symlink_to(root / "release")
+        (root / "broken").symlink_to(root / "nowhere")
+        (root / "file").write_text("")
+
+        paths = {
+            f"{root}/current": "symbolic link",
+            f"{root}/current/": "directory",
+            f"{root}/broken": "symbolic link",
+            f"{root}/broken/": "missing",
+            f"{root}/file": "regular file",
+            f"{root}/nowhere": "missing",
+        }
+        self.assertEqual(probe_paths(Context(), *paths), paths)
+
+
+if __name__ == "__main__":
+    unittest.main()